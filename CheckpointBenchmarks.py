@@ -0,0 +1,89 @@
+# force floating point division. Can still use integer with //
+from __future__ import division
+# other good compatibility recquirements for python3
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+# This file is used for timing the caching in CheckpointUtilities. Run as
+# python -m <package>.CheckpointBenchmarks
+import numpy as np
+import tempfile
+import shutil
+import time
+
+from . import CheckpointUtilities
+
+def _time_it(func,n_repeats=3):
+    """
+    Args:
+        func: no-argument function to time
+        n_repeats: how many times to call it
+    Returns:
+        tuple of (best time in seconds, whatever the last call returned) 
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.time()
+        ret = func()
+        times.append(time.time()-start)
+    return min(times),ret
+
+def _synthetic_cache(cache_dir,n_small=5000,n_large=8,small_size=100,
+                     large_size=int(5e6)):
+    """
+    writes a cache like what multi_load makes: many small curves, and a few
+    large ones
+
+    Args:
+        cache_dir: where to write
+        n_<small/large>: how many of each to write 
+        <small/large>_size: number of floats in each 
+    Returns:
+        load_func which would re-create the cache 
+    """
+    sizes = [small_size] * n_small + [large_size] * n_large
+    def load_func():
+        for i,n in enumerate(sizes):
+            yield dict(id=i,x=np.arange(n,dtype=np.float64),meta=[i] * 10)
+    CheckpointUtilities.multi_load(cache_dir,load_func,force=True)
+    return load_func
+
+def multi_load_workers(workers=(2,4,8),pools=("thread","process"),**kw):
+    """
+    times multi_load on a synthetic cache, serially and in parallel
+
+    Args:
+        workers: list of worker counts to try 
+        pools: which pools to try
+        **kw: passed to _synthetic_cache
+    Returns:
+        dictionary of (pool,workers) -> best time. The serial time is under
+        ("serial",1)
+    """
+    cache_dir = tempfile.mkdtemp() + "/"
+    try:
+        load_func = _synthetic_cache(cache_dir,**kw)
+        times = dict()
+        serial = lambda: CheckpointUtilities.multi_load(cache_dir,load_func)
+        times[("serial",1)],_ = _time_it(serial)
+        for pool in pools:
+            for w in workers:
+                f = lambda: CheckpointUtilities.multi_load(cache_dir,load_func,
+                                                           workers=w,pool=pool)
+                times[(pool,w)],_ = _time_it(f)
+    finally:
+        shutil.rmtree(cache_dir)
+    return times
+
+def run():
+    """
+    prints the timings of the benchmarks in this file
+    """
+    times = multi_load_workers()
+    serial = times[("serial",1)]
+    print("multi_load, by (pool,workers):")
+    for (pool,w),t in sorted(times.items()):
+        print("\t{:s}, {:}: {:.3f}s ({:.2f}x serial)".format(pool,w,t,serial/t))
+
+if __name__ == "__main__":
+    run()
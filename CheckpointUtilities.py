@@ -6,9 +6,72 @@ from __future__ import print_function
 from __future__ import unicode_literals
 pipe_fileIdx = 0
 pipe_funcIdx = 1
+# checkpoints with this extension are stored as an aligned container of raw
+# .npy records, and are memory-mapped (not read) on load; see _npycSave
+mmap_ext = ".npyc"
+# checkpoints with this extension are pickled (protocol 5) with their large
+# buffers (e.g. numpy arrays) stored out of band, and mapped on load; see
+# _oobSave
+oob_ext = ".pkl5"
+# checkpoints with this extension are ChunkedArray stores, which read only 
+# the chunks a slice needs
+chunk_ext = ".npch"
+# checkpoints with this extension are GrowableArray files, which append 
+# rows in place and map the rows committed so far on load
+grow_ext = ".npga"
 
 from . import GenUtilities as pGenUtil
 import numpy as np
+import hashlib
+import os
+import threading
+import struct
+import json
+import time
+import re
+import csv
+import mmap
+import io
+import gzip
+import bz2
+import lzma
+import functools
+import inspect
+import itertools
+import atexit
+import binascii
+import sys
+import ast
+import tempfile
+from collections import OrderedDict,deque
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor,\
+    wait,FIRST_COMPLETED
+from contextlib import contextmanager,nullcontext
+try:
+    # python2
+    import Queue as queue
+except ImportError:
+    # python3
+    import queue
+try:
+    # advisory locks; only on posix. Elsewhere, checkpoints aren't locked
+    import fcntl
+except ImportError:
+    fcntl = None
+# optional (faster) compression codecs 
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    # python >= 3.8; without it, shared_load is not available
+    from multiprocessing import shared_memory,resource_tracker
+except ImportError:
+    shared_memory = None
 try:
     # python2
     import cPickle
@@ -19,7 +82,7 @@ except ImportError:
     kw_load = dict(encoding='latin1')
 
 
-from scipy.sparse import csc_matrix
+from scipy.sparse import csc_matrix,csr_matrix,issparse
 
 
 
@@ -35,13 +98,247 @@ def getCheckpoint(filePath,orCall,force,*args,**kwargs):
         **kwargs: args for the function 'orCall'
     
     Returns:
-       Whatever 'orCall' returns, or the cache.
+       Whatever 'orCall' returns, or the cache. For a filePath ending with 
+       chunk_ext (grow_ext), the ChunkedArray (GrowableArray) it is saved in,
+       whether or not it was just made.
     """
     # use the npz fil format, unpack arguments in the order they
     # are returned by 'orCall'. most 'intuitive', maybe less flexible
     print('Checkpoint: {:s} via {:s}'.format(filePath,str(orCall)))
     return _checkpointGen(filePath,orCall,force,True,False,*args,**kwargs)
 
+def getHashedCheckpoint(filePath,orCall,force,*args,**kwargs):
+    """
+    like getCheckpoint, except the cache is keyed by a hash of the arguments
+    and the code of 'orCall', so each variant is stored side by side with 
+    filePath as the stem (see hashed_path)
+
+    Args:
+        see getCheckpoint
+    Returns:
+        see getCheckpoint
+    """
+    keyed_path = hashed_path(filePath,orCall,*args,**kwargs)
+    return getCheckpoint(keyed_path,orCall,force,*args,**kwargs)
+
+def hashed_path(filePath,orCall,*args,**kwargs):
+    """
+    Args:
+        filePath: the 'base' path of the checkpoint 
+        others: see checkpoint_key
+    Returns:
+        filePath, with the (truncated) checkpoint key inserted before the 
+        extension, e.g. 'cache/fit.pkl' -> 'cache/fit_<key>.pkl'
+    """
+    key = checkpoint_key(orCall,*args,**kwargs)
+    base,ext = os.path.splitext(filePath)
+    return "{:s}_{:s}{:s}".format(base,key[:16],ext)
+
+def checkpoint_key(orCall,*args,**kwargs):
+    """
+    Args:
+        orCall: the function which makes the data
+        *args,**kwargs: what orCall would be called with
+    Returns:
+        hex digest, which changes iff the arguments or the code of orCall do.
+        Raises TypeError if an argument can't be pickled (or hashed as an 
+        array, container, or function), since it has no stable key.
+    """
+    h = hashlib.sha1()
+    _hash_function(h,orCall)
+    _hash_arguments(h,args,list(enumerate(args)))
+    _hash_arguments(h,kwargs,list(kwargs.items()))
+    return h.hexdigest()
+
+def _hash_code(h,code):
+    # hash the byte code and everything it refers to, but *not* the file
+    # name or line numbers (so moving a function doesn't invalidate it)
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf8'))
+    for c in code.co_consts:
+        if hasattr(c,'co_code'):
+            # nested function or lambda
+            _hash_code(h,c)
+        else:
+            h.update(repr(c).encode('utf8'))
+
+def _hash_function(h,func):
+    if hasattr(func,'func') and hasattr(func,'keywords'):
+        # functools.partial; the bound arguments are part of the key
+        _hash_function(h,func.func)
+        _hash_update(h,func.args)
+        _hash_update(h,func.keywords)
+        return
+    # bound methods hash as their underlying function
+    func = getattr(func,'__func__',func)
+    name = getattr(func,'__qualname__',getattr(func,'__name__',repr(func)))
+    module = getattr(func,'__module__',None)
+    h.update("{:}.{:}".format(module,name).encode('utf8'))
+    code = getattr(func,'__code__',None)
+    if code is not None:
+        _hash_code(h,code)
+        _hash_update(h,getattr(func,'__defaults__',None))
+        _hash_update(h,getattr(func,'__kwdefaults__',None))
+        _hash_closure(h,func)
+
+# functions whose closures are being hashed (on this thread), so that a 
+# function referring to itself doesn't recurse forever
+_hash_active = threading.local()
+
+def _hash_closure(h,func):
+    # the values a closure captured are as much a part of it as its code 
+    cells = getattr(func,'__closure__',None) or ()
+    active = getattr(_hash_active,'ids',None)
+    if (active is None):
+        active = _hash_active.ids = set()
+    if (len(cells) == 0 or id(func) in active):
+        return
+    active.add(id(func))
+    try:
+        for cell in cells:
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                # not assigned yet
+                h.update(b"empty cell")
+                continue
+            _hash_update(h,contents)
+    finally:
+        active.discard(id(func))
+
+def _hash_update(h,obj):
+    """
+    feeds obj into the hash h, recursing into containers so that numpy 
+    arrays are hashed from their buffers instead of being pickled 
+    """
+    if isinstance(obj,np.ndarray) and obj.dtype != object:
+        h.update("ndarray{:}{:}".format(obj.dtype.str,obj.shape).encode('utf8'))
+        h.update(np.ascontiguousarray(obj).view(np.uint8).data)
+    elif isinstance(obj,(list,tuple)):
+        h.update("{:s}{:d}".format(type(obj).__name__,len(obj)).encode('utf8'))
+        for o in obj:
+            _hash_update(h,o)
+    elif isinstance(obj,(set,frozenset)):
+        # iteration order depends on PYTHONHASHSEED, so sort the elements' 
+        # own digests instead
+        h.update("{:s}{:d}".format(type(obj).__name__,len(obj)).encode('utf8'))
+        for d in sorted(data_hash(o) for o in obj):
+            h.update(d.encode('utf8'))
+    elif isinstance(obj,dict):
+        h.update("dict{:d}".format(len(obj)).encode('utf8'))
+        for k in sorted(obj.keys(),key=repr):
+            _hash_update(h,k)
+            _hash_update(h,obj[k])
+    elif callable(obj) and hasattr(obj,'__code__'):
+        _hash_function(h,obj)
+    else:
+        try:
+            h.update(cPickle.dumps(obj,2))
+        except (cPickle.PicklingError,TypeError,AttributeError) as e:
+            # the repr usually has the address in it, so it would give a new
+            # key (and checkpoint) every run
+            raise TypeError("{:s} can't be pickled, so can't be hashed ({:})".\
+                            format(type(obj).__name__,e))
+
+def _hash_arguments(h,obj,named):
+    """
+    _hash_update(h,obj), except a TypeError says which of named (list of 
+    (name,value), covering obj) couldn't be hashed
+    """
+    try:
+        _hash_update(h,obj)
+    except TypeError:
+        for name,value in named:
+            try:
+                _hash_update(hashlib.sha1(),value)
+            except TypeError as e:
+                raise TypeError("argument {:}: {:}".format(name,e))
+        raise
+
+def checkpoint(cache_dir,ext=".pkl",memo_size=128,force_kwarg="force"):
+    """
+    decorator which memoizes a function to disk, keyed by a hash of its 
+    arguments (arrays by their buffers) and its code. For example:
+
+        @checkpoint("./cache/")
+        def fit(x,k=2):
+            ...
+        fit(x)              # computed and saved
+        fit(x,k=2)          # same arguments; from memory (or disk)
+        fit(x,force=True)   # re-computed and re-saved
+
+    Args:
+        cache_dir: results go in <cache_dir>/<module.function>/<key><ext>
+        ext: extension of the checkpoints; picks the format, see saveFile
+        memo_size: number of results also kept in memory (least recently 
+        used are dropped). 0 means only use the disk.
+        force_kwarg: name of the keyword which forces a re-compute; it isn't
+        passed to the function
+    Returns:
+        the decorator. The decorated function also has cache_path(*args,**kw)
+        giving where that call is saved, and clear_memo()
+    """
+    def decorator(func):
+        try:
+            signature = inspect.signature(func)
+        except (TypeError,ValueError):
+            signature = None
+        assert signature is None or force_kwarg not in signature.parameters,\
+            "{:} takes '{:s}'; pick another force_kwarg".format(func,
+                                                                force_kwarg)
+        # the function's part of the key is the same for every call 
+        base = hashlib.sha1()
+        _hash_function(base,func)
+        name = "{:}.{:}".format(getattr(func,'__module__',None),
+                                getattr(func,'__qualname__',
+                                        getattr(func,'__name__','func')))
+        directory = os.path.join(cache_dir,re.sub(r"[^\w.\-]","_",name),'')
+        use_npy = not ext.endswith(".pkl")
+        memo = OrderedDict()
+        memo_lock = threading.Lock()
+        def key_of(args,kwargs):
+            h = base.copy()
+            if (signature is not None):
+                # so that f(x,2) and f(x,k=2) (and f(x), if 2 is the 
+                # default) share a checkpoint
+                bound = signature.bind(*args,**kwargs)
+                bound.apply_defaults()
+                arguments = dict(bound.arguments)
+                _hash_arguments(h,arguments,list(arguments.items()))
+            else:
+                _hash_arguments(h,args,list(enumerate(args)))
+                _hash_arguments(h,kwargs,list(kwargs.items()))
+            return h.hexdigest()
+        def cache_path(*args,**kwargs):
+            return directory + key_of(args,kwargs) + ext
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            force = kwargs.pop(force_kwarg,False)
+            key = key_of(args,kwargs)
+            if (memo_size and not force):
+                with memo_lock:
+                    if key in memo:
+                        memo.move_to_end(key)
+                        _stats.record(directory + key + ext,hits=1,
+                                      memory_hits=1)
+                        return memo[key]
+            data = _checkpointGen(directory + key + ext,func,force,True,
+                                  use_npy,*args,**kwargs)
+            if (memo_size):
+                with memo_lock:
+                    memo[key] = data
+                    memo.move_to_end(key)
+                    while len(memo) > memo_size:
+                        memo.popitem(last=False)
+            return data
+        def clear_memo():
+            with memo_lock:
+                memo.clear()
+        wrapper.cache_path = cache_path
+        wrapper.clear_memo = clear_memo
+        return wrapper
+    return decorator
+
 def _npyLoad(filePath,unpack):
     data  = np.load(filePath)
     if (unpack == True):
@@ -54,11 +351,611 @@ def _npyLoad(filePath,unpack):
     else:
         return data
 
-def _npySave(filePath,dataToSave):
+def _npySave(fh,dataToSave):
+    # fh is an open file, so savez doesn't touch the extension
+    if (type(dataToSave) is tuple):
+        np.savez(fh,*dataToSave)
+    else:
+        np.savez(fh,dataToSave)
+
+# container layout: <magic><uint64 index offset><uint64 index length>, then
+# one standard .npy record (header + raw data) per array, each starting on a
+# page boundary, then a json index of the items. Each item is either a dense
+# array (one record) or a sparse matrix (its data, indices, and indptr 
+# records, plus its shape and format).
+_npyc_magic = b"CKPTNPYC"
+_npyc_prelude = struct.Struct("<8sQQ")
+_npyc_align = 4096
+# sparse formats stored as is; others are stored as csr, and converted back
+_npyc_sparse = dict(csc=csc_matrix,csr=csr_matrix)
+
+def _is_mmap_path(filePath):
+    return filePath.endswith(mmap_ext)
+
+def _npycWriteRecord(fh,arr):
+    # writes arr on the next page boundary, returning where it starts
+    start = -(-fh.tell() // _npyc_align) * _npyc_align
+    fh.write(b"\0" * (start-fh.tell()))
+    np.lib.format.write_array(fh,arr,allow_pickle=True)
+    return start
+
+def _npycSave(fh,dataToSave):
+    """
+    saves dataToSave (an array or sparse matrix, or a tuple of them) as a 
+    .npyc container
+
+    Args:
+        fh: file opened for binary writing, at its start
+        dataToSave: array or sparse matrix, or tuple of them
+    Returns:
+        nothing
+    """
     if (type(dataToSave) is tuple):
-        np.savez(filePath,*dataToSave)
+        values = list(dataToSave)
+    else:
+        values = [dataToSave]
+    items = []
+    # placeholder prelude; filled in once we know where the index is 
+    fh.write(_npyc_prelude.pack(_npyc_magic,0,0))
+    for v in values:
+        if issparse(v):
+            stored = v if v.format in _npyc_sparse else v.tocsr()
+            offsets = [_npycWriteRecord(fh,a) for a in 
+                       (stored.data,stored.indices,stored.indptr)]
+            items.append(dict(kind="sparse",offsets=offsets,
+                              shape=list(v.shape),stored=stored.format,
+                              format=v.format))
+        else:
+            offset = _npycWriteRecord(fh,np.asanyarray(v))
+            items.append(dict(kind="dense",offsets=[offset]))
+    index = json.dumps(dict(items=items)).encode('utf8')
+    index_offset = fh.tell()
+    fh.write(index)
+    fh.seek(0)
+    fh.write(_npyc_prelude.pack(_npyc_magic,index_offset,len(index)))
+
+def _npycRecord(fh,filePath,offset,mmap_mode):
+    fh.seek(offset)
+    version = np.lib.format.read_magic(fh)
+    if (version == (1,0)):
+        header = np.lib.format.read_array_header_1_0(fh)
     else:
-        np.savez(filePath,dataToSave)
+        header = np.lib.format.read_array_header_2_0(fh)
+    shape,fortran_order,dtype = header
+    order = 'F' if fortran_order else 'C'
+    if (mmap_mode is None or dtype.hasobject or 0 in shape):
+        # need to actually read (object arrays are pickled; empty arrays 
+        # can't be mapped)
+        fh.seek(offset)
+        return np.lib.format.read_array(fh,allow_pickle=True)
+    return np.memmap(filePath,dtype=dtype,shape=shape,order=order,
+                     mode=mmap_mode,offset=fh.tell())
+
+def _npycItem(fh,filePath,item,mmap_mode):
+    arrays = [_npycRecord(fh,filePath,o,mmap_mode) for o in item['offsets']]
+    if (item['kind'] == "dense"):
+        return arrays[0]
+    matrix = _npyc_sparse[item['stored']](tuple(arrays),
+                                          shape=tuple(item['shape']),
+                                          copy=False)
+    if (item['format'] != item['stored']):
+        matrix = matrix.asformat(item['format'])
+    return matrix
+
+def _npycLoad(filePath,unpack,mmap_mode='r'):
+    """
+    loads a .npyc container
+
+    Args:
+        filePath: where the container is
+        unpack: see _npyLoad
+        mmap_mode: passed to np.memmap; if None, reads the arrays into memory.
+        sparse matrices are made from the (mapped) data, indices, and indptr
+        without copying them.
+    Returns:
+        see _npyLoad; if not unpack, a dictionary like what np.load gives 
+    """
+    with open(filePath,'rb') as fh:
+        magic,index_offset,index_size = \
+            _npyc_prelude.unpack(fh.read(_npyc_prelude.size))
+        assert magic == _npyc_magic , \
+            "{:s} isn't a {:s} container".format(filePath,mmap_ext)
+        fh.seek(index_offset)
+        index = json.loads(fh.read(index_size).decode('utf8'))
+        if ('items' in index):
+            items = index['items']
+        else:
+            # containers from before sparse support: all dense
+            items = [dict(kind="dense",offsets=[o]) for o in index['offsets']]
+        arrays = [_npycItem(fh,filePath,i,mmap_mode) for i in items]
+    if (unpack == True):
+        if (len(arrays) == 1):
+            return arrays[0]
+        else:
+            return tuple(arrays)
+    else:
+        return dict( ("arr_{:d}".format(i),a) for i,a in enumerate(arrays))
+
+# out-of-band pickle layout: same prelude as .npyc (with its own magic), 
+# then the pickle stream, then each out-of-band buffer starting on a page 
+# boundary, then a json index of where the stream and buffers are.
+_oob_magic = b"CKPTPKL5"
+
+def _is_oob_path(filePath):
+    return filePath.endswith(oob_ext)
+
+def _oobSave(fh,dataToSave):
+    """
+    pickles dataToSave with protocol 5, writing any out-of-band buffers (e.g.
+    the data of contiguous numpy arrays) as separate, aligned segments 
+    instead of copying them into the pickle stream
+
+    Args:
+        fh: file opened for binary writing, at its start
+        dataToSave: anything picklable 
+    Returns:
+        nothing
+    """
+    assert cPickle.HIGHEST_PROTOCOL >= 5 , \
+        "{:s} needs pickle protocol 5 (python 3.8+)".format(oob_ext)
+    buffers = []
+    stream = cPickle.dumps(dataToSave,protocol=5,
+                           buffer_callback=buffers.append)
+    fh.write(_npyc_prelude.pack(_oob_magic,0,0))
+    segments = [ [fh.tell(),len(stream)] ]
+    fh.write(stream)
+    for b in buffers:
+        raw = b.raw()
+        start = -(-fh.tell() // _npyc_align) * _npyc_align
+        fh.write(b"\0" * (start-fh.tell()))
+        segments.append([start,raw.nbytes])
+        fh.write(raw)
+    index = json.dumps(dict(segments=segments)).encode('utf8')
+    index_offset = fh.tell()
+    fh.write(index)
+    fh.seek(0)
+    fh.write(_npyc_prelude.pack(_oob_magic,index_offset,len(index)))
+
+def _oobLoad(filePath,mmap_mode='r'):
+    """
+    loads what _oobSave saved
+
+    Args:
+        filePath: where the file is
+        mmap_mode: 'r' maps the buffers read-only, 'c' copy-on-write, and 
+        None reads the whole file into (writable) memory
+    Returns:
+        the object, whose buffers point into the mapped file (no copies)
+    """
+    with open(filePath,'rb') as fh:
+        if (mmap_mode is None):
+            raw = bytearray(fh.read())
+        else:
+            access = mmap.ACCESS_COPY if mmap_mode == 'c' else mmap.ACCESS_READ
+            raw = mmap.mmap(fh.fileno(),0,access=access)
+    view = memoryview(raw)
+    magic,index_offset,index_size = \
+        _npyc_prelude.unpack(view[:_npyc_prelude.size])
+    assert magic == _oob_magic , \
+        "{:s} isn't a {:s} file".format(filePath,oob_ext)
+    index = view[index_offset:index_offset+index_size].tobytes()
+    segments = json.loads(index.decode('utf8'))['segments']
+    slices = [view[o:o+n] for o,n in segments]
+    # slices of the view keep the map alive for as long as they are used
+    return cPickle.loads(slices[0],buffers=slices[1:])
+
+# a ChunkedArray at <path> keeps its chunks in <path>.<token><chunk_data_ext>,
+# with a new token each time the store is (re-)made
+chunk_data_ext = ".dat"
+# target size of each chunk of a ChunkedArray
+chunk_bytes = 1 << 20
+_chunk_magic = b"CKPTNPC2"
+# stores from before the data file had a token, in <path><chunk_data_ext>
+_chunk_magic_v1 = b"CKPTNPCH"
+
+def _is_chunk_path(filePath):
+    return filePath.endswith(chunk_ext)
+
+class ChunkedArray(object):
+    """
+    on-disk array (or tuple of arrays, all with the same length along their
+    first axis) stored as chunks of a fixed number of rows. Each chunk is a 
+    standard .npy record in the data file; <path> is an index naming the 
+    data file, then the number of rows and data offsets of each chunk. Slices 
+    read only the chunks they overlap, and appends write only new chunks
+    (a chunk only exists once its index record is written). Re-making the
+    store writes a new data file, so replacing the index switches readers 
+    from the old data to the new all at once.
+    """
+    # magic, number of arrays, rows per chunk, token of the data file 
+    _prelude = struct.Struct("<8sIQ16s")
+    _prelude_v1 = struct.Struct("<8sIQ")
+    def __init__(self,path):
+        """
+        opens an existing store; see create to make one
+
+        Args:
+            path: of the index 
+        """
+        self.path = path
+        self.refresh()
+    @classmethod
+    def create(cls,path,data,chunk_rows=None):
+        """
+        makes a new store at path, replacing whatever is there 
+
+        Args:
+            path: of the index 
+            data: array, or tuple of arrays
+            chunk_rows: rows per chunk. Default gives about chunk_bytes
+        Returns:
+            the ChunkedArray
+        """
+        pGenUtil.ensureDirExists(pGenUtil.getBasePath(path))
+        with _atomic_open(path) as fh:
+            cls._write_new(fh,path,data,chunk_rows)
+        cls._remove_stale(path)
+        return cls(path)
+    @classmethod
+    def _write_new(cls,index_fh,path,data,chunk_rows):
+        arrays = cls._as_arrays(data)
+        if (chunk_rows is None):
+            row_bytes = sum(a[:1].nbytes for a in arrays)
+            chunk_rows = max(1,chunk_bytes // max(row_bytes,1))
+        token = binascii.hexlify(os.urandom(8))
+        index_fh.write(cls._prelude.pack(_chunk_magic,len(arrays),chunk_rows,
+                                         token))
+        # nothing refers to this file until the index is in place 
+        with open(cls._data_path(path,token),'wb') as data_fh:
+            cls._write_chunks(index_fh,data_fh,arrays,chunk_rows)
+    @staticmethod
+    def _data_path(path,token):
+        if (token is None):
+            return path + chunk_data_ext
+        return "{:s}.{:s}{:s}".format(path,token.decode('ascii'),
+                                      chunk_data_ext)
+    @classmethod
+    def _remove_stale(cls,path):
+        """
+        removes the data files of the stores path used to be, once it has
+        been replaced. Files newer than the one in use (from a re-make which
+        hasn't replaced the index yet) are left alone.
+        """
+        current = cls(path).data_path
+        directory = os.path.dirname(os.path.abspath(path))
+        prefix = os.path.basename(path)
+        try:
+            newest = os.stat(current).st_mtime_ns
+        except OSError:
+            return
+        for f in os.listdir(directory):
+            if (not (f.startswith(prefix) and f.endswith(chunk_data_ext))):
+                continue
+            full = os.path.join(directory,f)
+            if (os.path.samefile(full,current)):
+                continue
+            middle = f[len(prefix):-len(chunk_data_ext)]
+            if (middle != "" and not re.match(r"^\.[0-9a-f]{16}$",middle)):
+                # some other file
+                continue
+            try:
+                if (os.stat(full).st_mtime_ns < newest):
+                    os.remove(full)
+            except OSError:
+                pass
+    @staticmethod
+    def _as_arrays(data):
+        if (type(data) is tuple):
+            arrays = [np.asanyarray(d) for d in data]
+        else:
+            arrays = [np.asanyarray(data)]
+        n = set(len(a) for a in arrays)
+        assert len(n) == 1 , "Arrays must all have the same length"
+        return arrays
+    @classmethod
+    def _write_chunks(cls,index_fh,data_fh,arrays,chunk_rows):
+        record = struct.Struct("<{:d}Q".format(1+len(arrays)))
+        n = len(arrays[0])
+        offset = data_fh.seek(0,os.SEEK_END)
+        for start in range(0,n,chunk_rows):
+            offsets = []
+            for a in arrays:
+                offsets.append(offset)
+                np.lib.format.write_array(data_fh,
+                                          np.ascontiguousarray(
+                                              a[start:start+chunk_rows]))
+                offset = data_fh.tell()
+            # data has to be there before the index says it is 
+            data_fh.flush()
+            n_rows = min(chunk_rows,n-start)
+            index_fh.write(record.pack(n_rows,*offsets))
+            index_fh.flush()
+    def refresh(self):
+        """
+        re-reads the index (e.g. to see chunks appended by other processes)
+        """
+        with open(self.path,'rb') as fh:
+            raw = fh.read()
+        if (raw[:len(_chunk_magic_v1)] == _chunk_magic_v1):
+            prelude = self._prelude_v1
+            _,self.n_arrays,self.chunk_rows = \
+                prelude.unpack(raw[:prelude.size])
+            token = None
+        else:
+            prelude = self._prelude
+            magic,self.n_arrays,self.chunk_rows,token = \
+                prelude.unpack(raw[:prelude.size])
+            assert magic == _chunk_magic , \
+                "{:s} isn't a {:s} store".format(self.path,chunk_ext)
+        self._header_size = prelude.size
+        self.data_path = self._data_path(self.path,token)
+        self._record = struct.Struct("<{:d}Q".format(1+self.n_arrays))
+        body = raw[prelude.size:]
+        n = len(body) // self._record.size
+        table = np.frombuffer(body[:n*self._record.size],dtype='<u8').\
+            reshape((n,1+self.n_arrays))
+        self._rows = table[:,0].astype(np.int64)
+        self._offsets = table[:,1:].astype(np.int64)
+        self._starts = np.concatenate(([0],np.cumsum(self._rows)))
+    @property
+    def n_chunks(self):
+        return len(self._rows)
+    def __len__(self):
+        return int(self._starts[-1])
+    def read(self,start=0,stop=None):
+        """
+        Args:
+            start,stop: rows to read, as in a slice (no negatives)
+        Returns:
+            rows [start,stop) of the array (or a tuple, one per array),
+            reading only the chunks which overlap them
+        """
+        stop = len(self) if stop is None else min(stop,len(self))
+        start = min(start,stop)
+        if (start == stop):
+            # nothing to read, but we still want the right dtype and shape
+            chunks = range(min(1,self.n_chunks))
+        else:
+            first = np.searchsorted(self._starts,start,side='right')-1
+            last = np.searchsorted(self._starts,stop,side='left')
+            chunks = range(first,last)
+        if (len(chunks) == 0):
+            # empty store 
+            empty = np.empty(0)
+            return empty if self.n_arrays == 1 else (empty,) * self.n_arrays
+        try:
+            fh = open(self.data_path,'rb')
+        except FileNotFoundError:
+            # the store was re-made (and its old data removed) since we read
+            # the index; carry on with the new one
+            old = self.data_path
+            self.refresh()
+            if (self.data_path == old):
+                raise
+            return self.read(start,stop)
+        pieces = [ [] for _ in range(self.n_arrays)]
+        with fh:
+            for i in chunks:
+                lo = min(max(start-self._starts[i],0),self._rows[i])
+                hi = max(min(stop,self._starts[i+1]) - self._starts[i],lo)
+                for k in range(self.n_arrays):
+                    fh.seek(self._offsets[i,k])
+                    chunk = np.lib.format.read_array(fh)
+                    pieces[k].append(chunk[lo:hi])
+        arrays = [np.concatenate(p) for p in pieces]
+        return arrays[0] if self.n_arrays == 1 else tuple(arrays)
+    def __getitem__(self,idx):
+        """
+        Args:
+            idx: int, slice, or tuple starting with either; the first axis is
+            read from disk, the rest is applied to what is read 
+        Returns:
+            see read
+        """
+        rest = ()
+        if (isinstance(idx,tuple)):
+            idx,rest = idx[0],idx[1:]
+        if (isinstance(idx,slice)):
+            start,stop,step = idx.indices(len(self))
+            if (step < 0):
+                # read the (forward) span; the step then reverses it 
+                out = self.read(stop+1,start+1)
+            else:
+                out = self.read(start,stop)
+            sel = (slice(None,None,step),) + rest
+        else:
+            i = int(idx)
+            if (i < 0):
+                i += len(self)
+            if not (0 <= i < len(self)):
+                raise IndexError("{:d} out of range for {:d} rows".\
+                                 format(int(idx),len(self)))
+            out = self.read(i,i+1)
+            sel = (0,) + rest
+        if (self.n_arrays == 1):
+            return out[sel]
+        return tuple(o[sel] for o in out)
+    def append(self,data):
+        """
+        appends rows (an array, or a tuple like the one the store was made 
+        with), writing only new chunks 
+        """
+        arrays = self._as_arrays(data)
+        with FileLock(self.path + lock_ext):
+            # the store may have been re-made (with new data) since we looked
+            self.refresh()
+            assert len(arrays) == self.n_arrays , \
+                "Store has {:d} arrays, not {:d}".format(self.n_arrays,
+                                                        len(arrays))
+            with open(self.data_path,'ab') as data_fh, \
+                 open(self.path,'ab') as index_fh:
+                # drop any partial record from an append which died
+                body = index_fh.seek(0,os.SEEK_END) - self._header_size
+                n = body // self._record.size
+                index_fh.truncate(self._header_size + n * self._record.size)
+                index_fh.seek(0,os.SEEK_END)
+                self._write_chunks(index_fh,data_fh,arrays,self.chunk_rows)
+        _memory_cache.invalidate(os.path.abspath(self.path))
+        self.refresh()
+    def __repr__(self):
+        return "ChunkedArray({:s},{:d} rows in {:d} chunks)".\
+            format(self.path,len(self),self.n_chunks)
+
+# layout: <magic><uint64 rows committed><uint32 header length> and a header 
+# (dtype, shape of a row; a python literal, as in .npy) in the first page, 
+# then the raw rows (C order) from the second page on. Rows past the 
+# committed count (e.g. from an append which died) are ignored, and 
+# overwritten by the next append.
+_grow_magic = b"CKPTNPGA"
+_grow_prelude = struct.Struct("<8sQI")
+_grow_count = struct.Struct("<Q")
+_grow_data_offset = 4096
+
+def _is_grow_path(filePath):
+    return filePath.endswith(grow_ext)
+
+class GrowableArray(object):
+    """
+    on-disk array which only ever grows along its first axis. An append 
+    writes just the new rows, then bumps the committed row count in the 
+    header; readers map only the rows committed when they (re)read the 
+    header, so they never see a partial append.
+    """
+    def __init__(self,path):
+        """
+        opens an existing file; see create to make one
+
+        Args:
+            path: of the file 
+        """
+        self.path = path
+        with open(path,'rb') as fh:
+            raw = fh.read(_grow_data_offset)
+        magic,_,n_header = _grow_prelude.unpack_from(raw,0)
+        assert magic == _grow_magic , \
+            "{:s} isn't a {:s} file".format(path,grow_ext)
+        start = _grow_prelude.size
+        header = ast.literal_eval(raw[start:start+n_header].decode('utf8'))
+        self.dtype = np.lib.format.descr_to_dtype(header["descr"])
+        self.row_shape = tuple(header["row_shape"])
+        self.row_bytes = self.dtype.itemsize * \
+            int(np.prod(self.row_shape,dtype=np.int64))
+        self.refresh()
+    @classmethod
+    def create(cls,path,data):
+        """
+        makes a new file at path, replacing whatever is there 
+
+        Args:
+            path: of the file
+            data: initial rows; may have length 0, but fixes the dtype and 
+            the shape of each row
+        Returns:
+            the GrowableArray
+        """
+        pGenUtil.ensureDirExists(pGenUtil.getBasePath(path))
+        with _atomic_open(path) as fh:
+            cls._write_new(fh,data)
+        return cls(path)
+    @staticmethod
+    def _write_new(fh,data):
+        data = np.ascontiguousarray(data)
+        assert data.ndim >= 1 and not data.dtype.hasobject , \
+            "Need an array of (non-object) rows"
+        header = repr(dict(descr=np.lib.format.dtype_to_descr(data.dtype),
+                           row_shape=data.shape[1:])).encode('utf8')
+        assert _grow_prelude.size + len(header) <= _grow_data_offset , \
+            "dtype is too complicated to store"
+        fh.write(_grow_prelude.pack(_grow_magic,len(data),len(header)))
+        fh.write(header)
+        fh.write(b"\0" * (_grow_data_offset - fh.tell()))
+        fh.write(data.data)
+    def refresh(self):
+        """
+        re-reads the committed row count (e.g. to see rows appended by other
+        processes)
+        """
+        with open(self.path,'rb') as fh:
+            fh.seek(len(_grow_magic))
+            self._n = _grow_count.unpack(fh.read(_grow_count.size))[0]
+        self._array = None
+    def __len__(self):
+        return self._n
+    @property
+    def shape(self):
+        return (self._n,) + self.row_shape
+    @property
+    def array(self):
+        """
+        the committed rows, as a read-only memory map (so nothing is read 
+        until used). Its length is fixed until the next refresh.
+        """
+        if (self._array is None):
+            if (self._n == 0 or self.row_bytes == 0):
+                # can't map zero bytes 
+                self._array = np.empty(self.shape,dtype=self.dtype)
+            else:
+                self._array = np.memmap(self.path,dtype=self.dtype,mode='r',
+                                        offset=_grow_data_offset,
+                                        shape=self.shape)
+        return self._array
+    def __getitem__(self,idx):
+        return self.array[idx]
+    def __array__(self,dtype=None,copy=None):
+        return np.asarray(self.array,dtype=dtype)
+    def append(self,rows):
+        """
+        appends rows (an array shaped like the others, or a single row) in
+        place, writing only them 
+
+        Returns:
+            the new number of rows
+        """
+        rows = np.ascontiguousarray(rows,dtype=self.dtype)
+        if (rows.shape == self.row_shape):
+            rows = rows[np.newaxis]
+        assert rows.shape[1:] == self.row_shape , \
+            "Rows must have shape {:}, not {:}".format(self.row_shape,
+                                                      rows.shape[1:])
+        with FileLock(self.path + lock_ext):
+            with open(self.path,'r+b') as fh:
+                fh.seek(len(_grow_magic))
+                n = _grow_count.unpack(fh.read(_grow_count.size))[0]
+                end = _grow_data_offset + n * self.row_bytes
+                # drop anything from an append which died
+                fh.truncate(end)
+                fh.seek(end)
+                fh.write(rows.data)
+                # rows have to be there before the count says they are 
+                fh.flush()
+                fh.seek(len(_grow_magic))
+                fh.write(_grow_count.pack(n + len(rows)))
+        _memory_cache.invalidate(os.path.abspath(self.path))
+        self.refresh()
+        return self._n
+    def __repr__(self):
+        return "GrowableArray({:s},{:} {:s})".\
+            format(self.path,self.shape,str(self.dtype))
+
+def append_rows(filePath,rows):
+    """
+    appends rows to the GrowableArray at filePath, making it (from rows) if
+    it doesn't exist yet
+
+    Args:
+        filePath: ending with grow_ext 
+        rows: see GrowableArray.append 
+    Returns:
+        the GrowableArray
+    """
+    assert _is_grow_path(filePath) , \
+        "{:s} doesn't end with {:s}".format(filePath,grow_ext)
+    with FileLock(filePath + lock_ext):
+        if (not pGenUtil.isfile(filePath)):
+            return GrowableArray.create(filePath,rows)
+    store = GrowableArray(filePath)
+    store.append(rows)
+    return store
 
 def lazy_reload(file_path,data,force):
     """
@@ -78,48 +975,1388 @@ def lazy_reload(file_path,data,force):
 def lazy_save(file_path,data):
     return saveFile(file_path,data,useNpy=False)
 
-def lazy_load(file_path):
+def lazy_load(file_path,lazy=False):
+    """
+    Args:
+        file_path: pickle to load 
+        lazy: if true, returns a LazyHandle instead, which loads on first use
+    Returns:
+        the object in file_path (or a handle to it)
+    """
     assert pGenUtil.isfile(file_path) , \
         "File {:} doesn't exist".format(file_path)
+    if (lazy):
+        return LazyHandle(file_path)
     return loadFile(file_path,useNpy=False)
+
+class LazyHandle(object):
+    """
+    stands in for the object pickled at a path, loading it (once) on the 
+    first attribute or item access. Pickling a handle only pickles its path,
+    so handles are cheap to pass to other processes.
+    """
+    __slots__ = ("path","_n_bytes","_obj","_lock")
+    _not_loaded = object()
+    def __init__(self,path,n_bytes=None):
+        """
+        Args:
+            path: of the pickle 
+            n_bytes: its size, if known (otherwise found when asked for)
+        """
+        self.path = path
+        self._n_bytes = n_bytes
+        self._obj = LazyHandle._not_loaded
+        self._lock = threading.Lock()
+    @property
+    def n_bytes(self):
+        if (self._n_bytes is None):
+            self._n_bytes = os.path.getsize(self.path)
+        return self._n_bytes
+    @property
+    def loaded(self):
+        return self._obj is not LazyHandle._not_loaded
+    def load(self):
+        """
+        Returns:
+            the object, loading it if this is the first time 
+        """
+        if (not self.loaded):
+            with self._lock:
+                if (not self.loaded):
+                    self._obj = loadFile(self.path,useNpy=False)
+        return self._obj
+    def release(self):
+        """
+        drops the loaded object (it is re-loaded if used again)
+        """
+        with self._lock:
+            self._obj = LazyHandle._not_loaded
+    def __getattr__(self,name):
+        # only called for what isn't on the handle itself 
+        return getattr(self.load(),name)
+    def __getitem__(self,key):
+        return self.load()[key]
+    def __setitem__(self,key,value):
+        self.load()[key] = value
+    def __len__(self):
+        return len(self.load())
+    def __iter__(self):
+        return iter(self.load())
+    def __contains__(self,item):
+        return item in self.load()
+    def __array__(self,*args,**kwargs):
+        return np.asarray(self.load(),*args,**kwargs)
+    def __reduce__(self):
+        return (LazyHandle,(self.path,self._n_bytes))
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return "LazyHandle({:s},{:s})".format(self.path,state)
         
-def saveFile(filePath,dataToSave,useNpy):
-    path = pGenUtil.getBasePath(filePath)
-    pGenUtil.ensureDirExists(path)
+class MemoryCache(object):
+    """
+    process-local, size-bounded LRU cache of loaded files. Entries are keyed 
+    by path and dropped as soon as the file's mtime or size changes. The 
+    size of an entry is what it takes in memory (see _object_bytes), or the
+    size of its file on disk if that is bigger.
+
+    Note that hits return the *same* object each time; callers which mutate
+    what they load should copy it first.
+    """
+    def __init__(self,max_bytes=0):
+        """
+        Args:
+            max_bytes: budget for all entries. 0 or None disables the cache
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    @property
+    def enabled(self):
+        return bool(self.max_bytes)
+    @property
+    def n_bytes(self):
+        return self._bytes
+    def __len__(self):
+        return len(self._entries)
+    def __contains__(self,path):
+        return path in self._entries
+    def get(self,path,stamp,default=None):
+        """
+        Args:
+            path: key of the entry
+            stamp: the current (mtime,size) of path; see _file_stamp
+            default: returned on a miss
+        Returns:
+            the cached object if it is still valid, otherwise default
+        """
+        with self._lock:
+            entry = self._entries.get(path,None)
+            if entry is None:
+                return default
+            if entry[0] != stamp:
+                # file changed underneath us 
+                self._pop(path)
+                return default
+            # mark as most recently used
+            self._entries.move_to_end(path)
+            return entry[2]
+    def put(self,path,stamp,n_bytes,data):
+        with self._lock:
+            self._pop(path)
+            if (not self.enabled) or n_bytes > self.max_bytes:
+                return
+            self._entries[path] = (stamp,n_bytes,data)
+            self._bytes += n_bytes
+            self._evict()
+    def invalidate(self,path):
+        with self._lock:
+            self._pop(path)
+    def resize(self,max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    def _pop(self,path):
+        entry = self._entries.pop(path,None)
+        if entry is not None:
+            self._bytes -= entry[1]
+    def _evict(self):
+        # drop least recently used until we fit 
+        while self._entries and self._bytes > (self.max_bytes or 0):
+            _,entry = self._entries.popitem(last=False)
+            self._bytes -= entry[1]
+
+def _object_bytes(obj,seen=None):
+    """
+    Returns:
+        estimate of the bytes obj takes in memory, including everything it 
+        refers to (counting what is shared once)
+    """
+    seen = set() if seen is None else seen
+    if (id(obj) in seen):
+        return 0
+    seen.add(id(obj))
+    if (isinstance(obj,np.ndarray)):
+        # views are counted as their own data; close enough 
+        n = obj.nbytes
+        if (obj.dtype.hasobject):
+            n += sum(_object_bytes(o,seen) for o in obj.flat)
+        return n
+    n = sys.getsizeof(obj)
+    if (isinstance(obj,(str,bytes,bytearray,int,float,complex,bool))):
+        return n
+    if (isinstance(obj,dict)):
+        items = list(obj.keys()) + list(obj.values())
+    elif (isinstance(obj,(list,tuple,set,frozenset,deque))):
+        items = obj
+    elif (hasattr(obj,'__dict__')):
+        # e.g. sparse matrices, whose arrays are attributes 
+        items = vars(obj).values()
+    else:
+        items = ()
+    return n + sum(_object_bytes(o,seen) for o in items)
+
+# shared by all of loadFile; disabled until set_memory_cache_bytes is called
+_memory_cache = MemoryCache(max_bytes=0)
+# sentinel for lookups, since None is a perfectly good thing to cache
+_cache_miss = object()
+
+def set_memory_cache_bytes(max_bytes):
+    """
+    sets the byte budget for the in-memory tier in front of loadFile
+
+    Args:
+        max_bytes: budget, in bytes of the loaded objects (at least the size
+        of their files on disk). 0 or None disables
+    Returns:
+        the (module-level) MemoryCache
+    """
+    _memory_cache.resize(max_bytes)
+    return _memory_cache
+
+def clear_memory_cache():
+    _memory_cache.clear()
+
+# segment layout: <magic><uint64 index length> and a json index of the 
+# arrays (dtype, shape, offset) in the first page, a table of the ids of the
+# processes holding the segment (one int64 per handle, 0 if free) in the 
+# second, then each array's data, starting on a page boundary. The table is 
+# only touched under the segment's lock file (in shared_dir), and stands in 
+# for a reference count which a process that dies can't leave too high.
+_shared_magic = b"CKPTSHM1"
+_shared_header = struct.Struct("<8sQ")
+_shared_page = 4096
+_shared_slots = _shared_page // 8
+# where the lock files for the segments live
+shared_dir = os.path.join(tempfile.gettempdir(),"checkpoint_shm")
+# handles this process hasn't released yet; released at exit
+_shared_open = set()
+_shared_open_lock = threading.Lock()
+
+def _shared_name(filePath):
+    """
+    Returns:
+        name of the segment for the current contents of filePath; a rewrite
+        of the file gets a new segment
+    """
+    key = "{:s}\t{:d}\t{:d}".format(os.path.abspath(filePath),
+                                     *_file_stamp(filePath))
+    return "ckpt_" + hashlib.sha1(key.encode('utf8')).hexdigest()[:24]
+
+def _shared_arrays(data):
+    """
+    Returns:
+        tuple of (list of the arrays in data,whether data is a single array)
+    """
+    single = isinstance(data,np.ndarray)
+    arrays = [data] if single else data
+    if (isinstance(arrays,(tuple,list)) and len(arrays) > 0 and
+        all(isinstance(d,np.ndarray) and not d.dtype.hasobject 
+            for d in arrays)):
+        return [np.asarray(d) for d in arrays],single
+    raise ValueError("only (non-object) arrays, or tuples of them, can be " + 
+                     "shared, not {:s}".format(str(type(data))))
+
+def _shared_publish(name,data):
+    arrays,single = _shared_arrays(data)
+    items = []
+    offset = 2 * _shared_page
+    for a in arrays:
+        items.append(dict(dtype=a.dtype.str,shape=list(a.shape),offset=offset))
+        offset += -(-max(a.nbytes,1) // _shared_page) * _shared_page
+    index = json.dumps(dict(items=items,single=single)).encode('utf8')
+    if (_shared_header.size + len(index) > _shared_page):
+        raise ValueError("too many arrays to share in one segment")
+    shm = shared_memory.SharedMemory(name=name,create=True,size=offset)
+    buf = shm.buf
+    buf[:_shared_header.size] = _shared_header.pack(_shared_magic,len(index))
+    start = _shared_header.size
+    buf[start:start+len(index)] = index
+    for a,item in zip(arrays,items):
+        view = np.ndarray(a.shape,dtype=a.dtype,buffer=buf,
+                          offset=item["offset"])
+        view[...] = a
+        # the segment can't be closed while a view of it is alive
+        del view
+    return shm
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # someone else's process
+        pass
+    return True
+
+def _shared_holders(shm):
+    """
+    Returns:
+        the segment's table of holders, with any processes which have died
+        (without releasing) dropped
+    """
+    holders = np.ndarray((_shared_slots,),dtype=np.int64,buffer=shm.buf,
+                         offset=_shared_page)
+    for i in np.flatnonzero(holders):
+        if (not _pid_alive(int(holders[i]))):
+            holders[i] = 0
+    return holders
+
+def _shared_hold(shm):
+    holders = _shared_holders(shm)
+    free = np.flatnonzero(holders == 0)
+    if (free.size == 0):
+        raise RuntimeError("segment {:s} has {:d} holders already".\
+                           format(shm.name,_shared_slots))
+    holders[free[0]] = os.getpid()
+
+def _shared_release(shm):
+    """
+    Returns:
+        number of handles still holding shm 
+    """
+    holders = _shared_holders(shm)
+    mine = np.flatnonzero(holders == os.getpid())
+    if (mine.size > 0):
+        holders[mine[0]] = 0
+    return int(np.count_nonzero(holders))
+
+def _shared_untrack(shm):
+    # lifetimes are managed by the reference count, so the resource tracker 
+    # mustn't unlink the segment when the process that made it exits
+    try:
+        resource_tracker.unregister(shm._name,"shared_memory")
+    except Exception:
+        pass
+
+def _shared_unlink(shm):
+    # unlink tells the tracker to forget the segment; it has to know it first
+    try:
+        resource_tracker.register(shm._name,"shared_memory")
+    except Exception:
+        pass
+    shm.unlink()
+
+class _SharedSegment(object):
+    """
+    base of every array viewing a segment, so that the segment stays mapped
+    until the last of them is gone
+    """
+    def __init__(self,shm):
+        self.shm = shm
+        address = np.frombuffer(shm.buf,dtype=np.uint8).ctypes.data
+        self.__array_interface__ = dict(version=3,shape=(shm.size,),
+                                        typestr="|u1",data=(address,True))
+    def view(self,dtype,shape,offset):
+        n_bytes = int(np.prod(shape,dtype=np.int64)) * dtype.itemsize
+        raw = np.asarray(self)[offset:offset+n_bytes]
+        return raw.view(dtype).reshape(shape)
+    def __del__(self):
+        self.shm.close()
+
+class SharedArray(object):
+    """
+    read-only view of a checkpoint's array(s) in shared memory; see 
+    shared_load. The segment is unlinked once every handle to it (in any 
+    process) is released.
+    """
+    def __init__(self,name,shm,file_path):
+        self.name = name
+        self.file_path = file_path
+        magic,n_index = _shared_header.unpack_from(shm.buf,0)
+        assert magic == _shared_magic , "not a checkpoint segment: " + name
+        start = _shared_header.size
+        index = json.loads(bytes(shm.buf[start:start+n_index]).decode('utf8'))
+        # the segment closes shm once it (and every array) is gone
+        self._segment = segment = _SharedSegment(shm)
+        arrays = [segment.view(np.dtype(item["dtype"]),tuple(item["shape"]),
+                               item["offset"]) for item in index["items"]]
+        self.data = arrays[0] if index["single"] else tuple(arrays)
+    @property
+    def released(self):
+        return self._segment is None
+    @property
+    def n_bytes(self):
+        return 0 if self.released else self._segment.shm.size
+    def release(self):
+        """
+        drops this handle's reference. Arrays taken from data stay valid 
+        (in this process) for as long as they are referenced
+        """
+        with _shared_open_lock:
+            segment,self._segment = self._segment,None
+            _shared_open.discard(self)
+        if (segment is None):
+            return
+        with FileLock(os.path.join(shared_dir,self.name + lock_ext)):
+            if (_shared_release(segment.shm) == 0):
+                _shared_unlink(segment.shm)
+        self.data = None
+    def __enter__(self):
+        return self
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.release()
+        return False
+
+def shared_load(filePath,useNpy=True,unpack=True):
+    """
+    loads the array(s) of a numpy checkpoint into shared memory, so every 
+    process on the machine loading the same (unchanged) file maps one copy.
+    The first process to ask loads the file (see loadFile) and publishes it;
+    the rest attach without copying. 
+
+    Args:
+        filePath,useNpy,unpack: see loadFile. The result must be an array or
+        a tuple of arrays.
+    Returns:
+        SharedArray; its data attribute has the (read-only) array(s). Call 
+        release (or use it as a context manager) when done. Handles still 
+        open when the process exits are released then.
+    """
+    if (shared_memory is None):
+        raise NotImplementedError("shared memory needs python >= 3.8")
+    name = _shared_name(filePath)
+    with FileLock(os.path.join(shared_dir,name + lock_ext)):
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            _stats.record(filePath,memory_hits=1)
+        except FileNotFoundError:
+            shm = _shared_publish(name,loadFile(filePath,useNpy,unpack=unpack,
+                                                mmap_mode=None))
+        _shared_untrack(shm)
+        _shared_hold(shm)
+    handle = SharedArray(name,shm,filePath)
+    with _shared_open_lock:
+        _shared_open.add(handle)
+    return handle
+
+def clear_shared(force=False):
+    """
+    releases every SharedArray this process holds. If force, also unlinks 
+    every checkpoint segment on the machine (e.g. ones left by processes 
+    which crashed), whoever holds them.
+
+    Returns:
+        number of segments unlinked by force
+    """
+    with _shared_open_lock:
+        handles = list(_shared_open)
+    for h in handles:
+        h.release()
+    if (not force or shared_memory is None or not os.path.isdir(shared_dir)):
+        return 0
+    n = 0
+    for f in os.listdir(shared_dir):
+        if (not f.endswith(lock_ext)):
+            continue
+        name = f[:-len(lock_ext)]
+        with FileLock(os.path.join(shared_dir,f)):
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                continue
+            _shared_untrack(shm)
+            _shared_unlink(shm)
+            shm.close()
+            n += 1
+    return n
+
+atexit.register(clear_shared)
+
+class CheckpointStats(object):
+    """
+    counts the hits, misses, and forced re-computes of each checkpoint, along
+    with the time spent loading, saving, and computing it and its size
+    """
+    # each is summed, except bytes (the latest size on disk)
+    fields = ("hits","misses","forced","loads","memory_hits","load_seconds",
+              "saves","save_seconds","compute_seconds","bytes")
+    def __init__(self,enabled=True,max_records=10000):
+        """
+        Args:
+            enabled: if false, record does nothing (see set_enabled)
+            max_records: most checkpoints to keep records of; past this, the
+            least recently recorded is dropped. None keeps everything.
+        """
+        self.enabled = enabled
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+    def set_enabled(self,enabled):
+        """
+        turns recording on or off; there is one record per checkpoint, so 
+        a long-lived process touching many files may want it off. Turning it
+        off keeps what was recorded so far (see reset).
+        """
+        self.enabled = enabled
+    def record(self,path,**kw):
+        """
+        Args:
+            path: the checkpoint 
+            **kw: amount to add to each of (some of) fields 
+        """
+        if (not self.enabled):
+            return
+        key = os.path.abspath(path)
+        with self._lock:
+            rec = self._records.get(key,None)
+            if (rec is None):
+                rec = dict( (f,0) for f in self.fields)
+                self._records[key] = rec
+                if (self.max_records is not None and 
+                    len(self._records) > self.max_records):
+                    self._records.popitem(last=False)
+            else:
+                self._records.move_to_end(key)
+            for f,v in kw.items():
+                if (f == "bytes"):
+                    rec[f] = v
+                else:
+                    rec[f] += v
+    def get(self,path):
+        """
+        Returns:
+            dictionary of field -> value for path (all zero if never seen)
+        """
+        with self._lock:
+            rec = self._records.get(os.path.abspath(path),None)
+            return dict(rec) if rec is not None else \
+                dict( (f,0) for f in self.fields)
+    def totals(self):
+        """
+        Returns:
+            dictionary of field -> value summed over every checkpoint 
+        """
+        with self._lock:
+            return dict( (f,sum(r[f] for r in self._records.values()))
+                         for f in self.fields)
+    def report(self):
+        """
+        Returns:
+            list of dictionaries, one per checkpoint, with the path, each of
+            fields, and net_seconds: the compute time hits saved, less the 
+            time spent loading and saving. When the checkpoint wasn't 
+            computed in this process, the compute time recorded when it was 
+            saved (see read_costs) is used.
+        """
+        with self._lock:
+            records = [(k,dict(r)) for k,r in self._records.items()]
+        costs = dict()
+        rows = []
+        for path,rec in records:
+            n_computed = rec["misses"] + rec["forced"]
+            if (n_computed > 0):
+                per_compute = rec["compute_seconds"]/n_computed
+            else:
+                directory,name = os.path.split(path)
+                if directory not in costs:
+                    costs[directory] = read_costs(directory)
+                per_compute = costs[directory].get(name,0)
+            rec["path"] = path
+            rec["net_seconds"] = rec["hits"] * per_compute - \
+                rec["load_seconds"] - rec["save_seconds"]
+            rows.append(rec)
+        return rows
+    def write_report(self,out_path):
+        """
+        writes report() to out_path, as json if it ends with .json, otherwise
+        as csv
+        """
+        rows = self.report()
+        columns = ["path"] + list(self.fields) + ["net_seconds"]
+        if (out_path.endswith(".json")):
+            with open(out_path,'w') as fh:
+                json.dump(rows,fh,indent=1)
+        else:
+            with open(out_path,'w',newline='') as fh:
+                writer = csv.DictWriter(fh,fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+# every checkpoint operation in this process is recorded here 
+_stats = CheckpointStats()
+
+def checkpoint_stats():
+    """
+    Returns:
+        the CheckpointStats for this process
+    """
+    return _stats
+
+# compressed pickles start with this, then one byte giving the length of the
+# codec's name, then the name, then the compressed pickle stream 
+_codec_magic = b"CKPTCODC"
+# name -> (function giving a writer, function giving a reader); each takes
+# an open binary file, which closing the writer or reader must not close
+_codecs = OrderedDict()
+# codec used by saveFile when none is given. None means no compression. 
+default_codec = None
+# bytes per second to and from storage, used by the 'auto' codec to trade 
+# compression ratio against (de)compression time
+codec_bandwidth = 100e6
+# bytes of the pickle which the 'auto' codec tries each codec on 
+codec_sample_bytes = int(1e6)
+
+def register_codec(name,writer,reader):
+    """
+    adds a codec for saveFile and loadFile
+
+    Args:
+        name: of the codec (at most 255 bytes), as recorded in each file
+        writer: takes a binary file open for writing, returns a file-like 
+        object compressing into it
+        reader: takes a binary file open for reading, returns a file-like 
+        object decompressing from it (read, readinto, and readline)
+    Returns:
+        nothing
+    """
+    _codecs[name] = (writer,reader)
+
+def available_codecs():
+    """
+    Returns:
+        list of the names of the codecs which can be used 
+    """
+    return list(_codecs.keys())
+
+register_codec("gzip",
+               lambda fh: gzip.GzipFile(fileobj=fh,mode='wb',compresslevel=6,
+                                        mtime=0),
+               lambda fh: gzip.GzipFile(fileobj=fh,mode='rb'))
+# names files may record which are now called something else; 'zlib' was 
+# always a gzip stream
+_codec_aliases = dict(zlib="gzip")
+register_codec("bz2",lambda fh: bz2.BZ2File(fh,mode='wb'),
+               lambda fh: bz2.BZ2File(fh,mode='rb'))
+register_codec("lzma",lambda fh: lzma.LZMAFile(fh,mode='wb',preset=1),
+               lambda fh: lzma.LZMAFile(fh,mode='rb'))
+if (lz4 is not None):
+    register_codec("lz4",lambda fh: lz4.frame.LZ4FrameFile(fh,mode='wb'),
+                   lambda fh: lz4.frame.LZ4FrameFile(fh,mode='rb'))
+if (zstandard is not None):
+    register_codec("zstd",
+                   lambda fh: zstandard.ZstdCompressor(level=3).\
+                   stream_writer(fh,closefd=False),
+                   lambda fh: io.BufferedReader(zstandard.ZstdDecompressor().\
+                                                stream_reader(fh,
+                                                              closefd=False)))
+
+def _codec_roundtrip(name,raw):
+    """
+    Returns:
+        tuple of (seconds to compress, seconds to decompress, compressed size)
+        of raw with codec name
+    """
+    writer,reader = _codecs[name]
+    out = io.BytesIO()
+    start = time.time()
+    w = writer(out)
+    w.write(raw)
+    w.close()
+    compress = time.time() - start
+    compressed = out.getvalue()
+    start = time.time()
+    r = reader(io.BytesIO(compressed))
+    r.read()
+    r.close()
+    return compress,time.time()-start,len(compressed)
+
+def choose_codec(raw,bandwidth=None,sample_bytes=None):
+    """
+    picks the codec which is fastest end to end (compressing, writing, 
+    reading, decompressing) on a sample of raw
+
+    Args:
+        raw: bytes to be compressed 
+        bandwidth: bytes per second of storage; defaults to codec_bandwidth
+        sample_bytes: how much of raw to try; defaults to codec_sample_bytes
+    Returns:
+        name of the best codec, or None if not compressing is best
+    """
+    bandwidth = codec_bandwidth if bandwidth is None else bandwidth
+    sample_bytes = codec_sample_bytes if sample_bytes is None else sample_bytes
+    raw = memoryview(raw)
+    if (len(raw) > sample_bytes):
+        # take a few pieces from throughout, so we aren't fooled by a header
+        n_pieces = 4
+        step = len(raw) // n_pieces
+        size = sample_bytes // n_pieces
+        sample = b"".join(raw[i*step:i*step+size].tobytes() 
+                          for i in range(n_pieces))
+    else:
+        sample = raw.tobytes()
+    best,best_time = None,2 * len(sample) / bandwidth
+    for name in _codecs:
+        compress,decompress,size = _codec_roundtrip(name,sample)
+        total = compress + decompress + 2 * size / bandwidth
+        if (total < best_time):
+            best,best_time = name,total
+    return best
+
+def _codecDump(fh,dataToSave,codec):
+    # pickles dataToSave into fh, compressed with codec (maybe 'auto')
+    if (codec == "auto"):
+        raw = cPickle.dumps(dataToSave,cPickle.HIGHEST_PROTOCOL)
+        codec = choose_codec(raw)
+        if (codec is None):
+            fh.write(raw)
+            return
+    else:
+        raw = None
+    assert codec in _codecs , "Unknown codec {:}; have {:}".\
+        format(codec,available_codecs())
+    name = codec.encode('utf8')
+    fh.write(_codec_magic + struct.pack("<B",len(name)) + name)
+    w = _codecs[codec][0](fh)
+    if (raw is None):
+        cPickle.dump(dataToSave,w,cPickle.HIGHEST_PROTOCOL)
+    else:
+        w.write(raw)
+    w.close()
+
+# pickles whose (big) arrays live in a BlobStore start with this, then the 
+# pickle, in which each such array is a persistent id of (_blob_tag,path of 
+# its blob relative to the pickle's directory) 
+_blob_magic = b"CKPTBLOB"
+_blob_tag = "ckpt_blob"
+# arrays smaller than this (in bytes) are pickled as usual
+blob_min_bytes = 1 << 16
+# CacheManager leaves alone blobs saved (or re-used) more recently than this
+blob_grace_seconds = 60
+# where saveFile puts arrays; None (the default) keeps them in the pickles
+_blob_store = None
+# marks the root of a BlobStore, so CacheManager doesn't take the blobs for
+# checkpoints of their own
+blob_root_marker = ".blobstore"
+
+class BlobStore(object):
+    """
+    content-addressed store of arrays: each is saved once, as an .npy file 
+    named by the hash of its contents (see data_hash), no matter how many 
+    checkpoints refer to it
+    """
+    def __init__(self,root,min_bytes=None):
+        """
+        Args:
+            root: directory of the blobs, e.g. a '.blobs' directory in the 
+            cache root
+            min_bytes: smallest array to store; defaults to blob_min_bytes
+        """
+        self.root = os.path.abspath(root)
+        self.min_bytes = blob_min_bytes if min_bytes is None else min_bytes
+        # bytes actually written, and those not written since they were here
+        self.bytes_written = 0
+        self.bytes_deduplicated = 0
+        pGenUtil.ensureDirExists(self.root)
+        marker = os.path.join(self.root,blob_root_marker)
+        if (not os.path.exists(marker)):
+            open(marker,'a').close()
+    def path(self,digest):
+        return os.path.join(self.root,digest[:2],digest + ".npy")
+    def __contains__(self,digest):
+        return os.path.exists(self.path(digest))
+    def wants(self,obj):
+        return (type(obj) in (np.ndarray,np.memmap) and 
+                not obj.dtype.hasobject and obj.nbytes >= self.min_bytes)
+    def put(self,array):
+        """
+        Returns:
+            path to the blob holding array, saving it only if it is new
+        """
+        blob = self.path(data_hash(np.asarray(array)))
+        if (os.path.exists(blob)):
+            # so min_age (see collect) counts from the latest save using it
+            os.utime(blob)
+            self.bytes_deduplicated += array.nbytes
+            return blob
+        pGenUtil.ensureDirExists(pGenUtil.getBasePath(blob))
+        with _atomic_open(blob) as fh:
+            np.save(fh,np.asarray(array),allow_pickle=False)
+        self.bytes_written += array.nbytes
+        return blob
+    def collect(self,cache_dirs,min_age=3600):
+        """
+        deletes the blobs no checkpoint under cache_dirs refers to
+
+        Args:
+            cache_dirs: list of directories to search (recursively) for
+            checkpoints; every checkpoint using this store must be in one
+            min_age: blobs younger than this (in seconds) are kept, since a 
+            checkpoint referring to them may be being saved now
+        Returns:
+            list of the blobs deleted
+        """
+        used = set()
+        for d in cache_dirs:
+            for base,_,files in os.walk(d):
+                if (os.path.abspath(base).startswith(self.root)):
+                    continue
+                for f in files:
+                    used.update(blob_refs(os.path.join(base,f)))
+        unused = []
+        for base,_,files in os.walk(self.root):
+            for f in files:
+                blob = os.path.join(base,f)
+                if (blob not in used and f.endswith(".npy")):
+                    unused.append(blob)
+        return _remove_blobs(unused,min_age)
+
+def _remove_blobs(blobs,min_age):
+    """
+    Returns:
+        list of blobs removed; those changed (or re-used) in the last min_age 
+        seconds are kept
+    """
+    removed = []
+    now = time.time()
+    for blob in blobs:
+        try:
+            if (now - os.path.getmtime(blob) < min_age):
+                continue
+            os.remove(blob)
+        except OSError:
+            # already gone
+            continue
+        removed.append(blob)
+    return removed
+
+def set_blob_store(root,min_bytes=None):
+    """
+    makes saveFile put the arrays of every pickled checkpoint in a BlobStore,
+    so identical arrays are only written once. Existing checkpoints load as
+    before, and blob-backed ones load whether or not a store is set.
+
+    Args:
+        root: directory for the blobs (see BlobStore), or None to go back to
+        saving arrays in the pickles 
+        min_bytes: see BlobStore
+    Returns:
+        the (module-level) BlobStore, or None
+    """
+    global _blob_store
+    _blob_store = None if root is None else BlobStore(root,min_bytes)
+    return _blob_store
+
+def _blobDump(fh,dataToSave,filePath,store):
+    base = os.path.dirname(os.path.abspath(filePath))
+    class _Pickler(cPickle.Pickler):
+        def persistent_id(self,obj):
+            if (not store.wants(obj)):
+                return None
+            return (_blob_tag,os.path.relpath(store.put(obj),base))
+    fh.write(_blob_magic)
+    _Pickler(fh,cPickle.HIGHEST_PROTOCOL).dump(dataToSave)
+
+def _blobLoad(fh,filePath,refs=None):
+    """
+    Args:
+        fh: file, just after _blob_magic
+        filePath: where fh is from
+        refs: if not None, the blobs referred to are added to this instead of
+        being loaded 
+    """
+    base = os.path.dirname(os.path.abspath(filePath))
+    class _Unpickler(cPickle.Unpickler):
+        def persistent_load(self,pid):
+            tag,rel = pid
+            assert tag == _blob_tag , "unknown persistent id {:}".format(pid)
+            blob = os.path.normpath(os.path.join(base,rel))
+            if (refs is not None):
+                refs.add(blob)
+                return None
+            # copy on write: nothing is read until used, and changes to the
+            # array never reach the blob (which other checkpoints may share)
+            return np.load(blob,mmap_mode='c')
+    return _Unpickler(fh,**kw_load).load()
+
+def blob_refs(filePath):
+    """
+    Returns:
+        set of the blobs the checkpoint at filePath refers to (empty if it 
+        isn't a blob-backed pickle)
+    """
+    refs = set()
+    try:
+        with open(filePath,'rb') as fh:
+            if (fh.read(len(_blob_magic)) == _blob_magic):
+                _blobLoad(fh,filePath,refs)
+    except (IOError,OSError):
+        pass
+    return refs
+
+def _file_stamp(filePath):
+    """
+    Returns:
+        tuple of (mtime in ns,size in bytes) for filePath 
+    """
+    stat = os.stat(filePath)
+    return (stat.st_mtime_ns,stat.st_size)
+
+class FileLock(object):
+    """
+    exclusive advisory (flock) lock on a file, shared between processes and
+    threads. A no-op where fcntl isn't available, or if lock_path is None.
+    """
+    def __init__(self,lock_path):
+        self.lock_path = lock_path
+        self._fh = None
+    def acquire(self):
+        if (self.lock_path is None):
+            return
+        pGenUtil.ensureDirExists(pGenUtil.getBasePath(self.lock_path))
+        while True:
+            fh = open(self.lock_path,'a')
+            if (fcntl is None):
+                break
+            fcntl.flock(fh.fileno(),fcntl.LOCK_EX)
+            # whoever held it may have removed the file (see remove); then 
+            # we locked a file no one else will, so try again
+            try:
+                if (os.stat(self.lock_path).st_ino == 
+                    os.fstat(fh.fileno()).st_ino):
+                    break
+            except FileNotFoundError:
+                pass
+            fh.close()
+        self._fh = fh
+    def remove(self):
+        """
+        deletes the lock file; only call this while holding the lock
+        """
+        if (self._fh is not None and os.path.exists(self.lock_path)):
+            os.remove(self.lock_path)
+    def release(self):
+        fh,self._fh = self._fh,None
+        if (fh is None):
+            return
+        if (fcntl is not None):
+            fcntl.flock(fh.fileno(),fcntl.LOCK_UN)
+        fh.close()
+    def __enter__(self):
+        self.acquire()
+        return self
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.release()
+        return False
+
+# appended to a checkpoint's path to get its lock file
+lock_ext = ".lock"
+# if false, _checkpointGen doesn't lock (e.g. on file systems without flock)
+use_file_locks = True
+
+def _checkpoint_lock(filePath):
+    if (use_file_locks):
+        return FileLock(filePath + lock_ext)
+    else:
+        return FileLock(None)
+
+@contextmanager
+def _atomic_open(filePath):
+    """
+    opens a temporary file next to filePath for binary writing; on success
+    it is renamed to filePath, so readers never see a partial file.
+    """
+    tmp = "{:s}.tmp{:d}_{:d}".format(filePath,os.getpid(),
+                                      threading.current_thread().ident)
+    try:
+        with open(tmp,'wb') as fh:
+            yield fh
+        os.replace(tmp,filePath)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _saved_path(filePath,useNpy):
+    """
+    Returns:
+        where saveFile(filePath,...,useNpy) actually puts the file
+    """
+    if (_is_mmap_path(filePath) or _is_oob_path(filePath) or 
+        _is_chunk_path(filePath) or _is_grow_path(filePath)):
+        return filePath
+    elif (useNpy):
+        return pGenUtil.ensureEnds(filePath,".npz")
+    else:
+        return pGenUtil.ensureEnds(filePath,".pkl")
+
+def _file_stamp_or_none(filePath):
+    try:
+        return _file_stamp(filePath)
+    except OSError:
+        return None
+
+class _Serialized(object):
+    # the bytes saveFile would write for some data, made ahead of time (see 
+    # _serialize); saveFile writes them as they are
+    def __init__(self,raw):
+        self.raw = raw
+
+def _write_data(fh,filePath,dataToSave,useNpy,codec=None):
+    # writes dataToSave to fh in the format saveFile uses for filePath (which
+    # is as from _saved_path)
+    codec = default_codec if codec is None else codec
     # need to figure out if we need to unpack all the arguments..
-    if (useNpy):
-        _npySave(filePath,dataToSave)
+    if (_is_mmap_path(filePath)):
+        # the extension picks the format, regardless of useNpy
+        _npycSave(fh,dataToSave)
+    elif (_is_oob_path(filePath)):
+        _oobSave(fh,dataToSave)
+    elif (_is_chunk_path(filePath)):
+        ChunkedArray._write_new(fh,filePath,dataToSave,None)
+    elif (_is_grow_path(filePath)):
+        GrowableArray._write_new(fh,dataToSave)
+    elif (useNpy):
+        _npySave(fh,dataToSave)
+    elif (_blob_store is not None):
+        # the arrays go to the store; the rest is small, so not compressed
+        _blobDump(fh,dataToSave,filePath,_blob_store)
+    elif (codec is not None):
+        _codecDump(fh,dataToSave,codec)
     else:
-        # open the file in binary format for writing
-        if (not filePath.endswith(".pkl")):
-            filePath = filePath + ".pkl"
-        with open(filePath, 'wb') as fh:
-            # XXX make protocol specifiable?
-            cPickle.dump(dataToSave,fh,cPickle.HIGHEST_PROTOCOL)
+        # XXX make protocol specifiable?
+        cPickle.dump(dataToSave,fh,cPickle.HIGHEST_PROTOCOL)
+
+def _serialize(filePath,dataToSave,useNpy):
+    """
+    Returns:
+        something to give saveFile(filePath,...,useNpy) in place of 
+        dataToSave, which saves dataToSave as it is now, even if it is 
+        changed in the meantime
+    """
+    if (_is_chunk_path(filePath)):
+        # written as two files, so just copy the data 
+        raw = cPickle.dumps(dataToSave,cPickle.HIGHEST_PROTOCOL)
+        return cPickle.loads(raw)
+    fh = io.BytesIO()
+    _write_data(fh,_saved_path(filePath,useNpy),dataToSave,useNpy)
+    return _Serialized(fh.getvalue())
+
+def saveFile(filePath,dataToSave,useNpy,codec=None):
+    """
+    saves dataToSave to filePath (the format depends on useNpy and the 
+    extension of filePath; see _saved_path)
+
+    Args:
+        filePath: where to save
+        dataToSave: what to save
+        useNpy: if true, saves as an npz
+        codec: for pickles, the name of the codec to compress with (see 
+        available_codecs), 'auto' to pick the fastest, or None for the 
+        default_codec. loadFile detects the codec itself.
+        Ignored if there is a blob store (see set_blob_store).
+    Returns:
+        nothing
+    """
+    start = time.time()
+    path = pGenUtil.getBasePath(filePath)
+    pGenUtil.ensureDirExists(path)
+    filePath = _saved_path(filePath,useNpy)
+    _memory_cache.invalidate(os.path.abspath(filePath))
+    # write everything to a temporary file first, so it appears atomically
+    with _atomic_open(filePath) as fh:
+        if (isinstance(dataToSave,_Serialized)):
+            fh.write(dataToSave.raw)
+        else:
+            _write_data(fh,filePath,dataToSave,useNpy,codec)
+    if (_is_chunk_path(filePath)):
+        ChunkedArray._remove_stale(filePath)
+    _stats.record(filePath,saves=1,save_seconds=time.time()-start,
+                  bytes=os.path.getsize(filePath))
 
-def loadFile(filePath,useNpy):
+def loadFile(filePath,useNpy,unpack=True,mmap_mode='r'):
     """
     
     Args:
         filePath: where the file to load is
         useNpy: if true, tries to load a number obbject
+        unpack: see _checkpointGen
+        mmap_mode: for files ending with mmap_ext or oob_ext, how to map the
+        arrays (see np.memmap). None means read them into memory.
     Returns;
-        the cached file if it exists, otherwise throws an error 
+        the cached file if it exists, otherwise throws an error. Files ending
+        with chunk_ext give a ChunkedArray, and those with grow_ext a 
+        GrowableArray.
     """
     # assuming file exists, loads it. God help you if you dont check existance
-    if (useNpy):
-        return _npyLoad(filePath,unpack)
+    start = time.time()
+    memory_hit = False
+    if (_is_mmap_path(filePath)):
+        data = _npycLoad(filePath,unpack,mmap_mode=mmap_mode)
+    elif (_is_oob_path(filePath)):
+        data = _oobLoad(filePath,mmap_mode=mmap_mode)
+    elif (_is_chunk_path(filePath)):
+        # nothing is read until it is sliced 
+        data = ChunkedArray(filePath)
+    elif (_is_grow_path(filePath)):
+        data = GrowableArray(filePath)
+    elif (useNpy):
+        data = _npyLoad(filePath,unpack)
+    elif (not _memory_cache.enabled):
+        data = _pklLoad(filePath)
     else:
-        # assume we pickle in binary
-        with open(filePath, 'rb') as fh:
-            data = cPickle.load(fh,**kw_load)
-        return data
+        # check the memory tier first 
+        key = os.path.abspath(filePath)
+        stamp = _file_stamp(filePath)
+        data = _memory_cache.get(key,stamp,default=_cache_miss)
+        if data is _cache_miss:
+            data = _pklLoad(filePath)
+            # compressed files can be far smaller than what they hold
+            n_bytes = max(stamp[1],_object_bytes(data))
+            _memory_cache.put(key,stamp,n_bytes,data)
+        else:
+            memory_hit = True
+    _stats.record(filePath,loads=1,memory_hits=int(memory_hit),
+                  load_seconds=time.time()-start,
+                  bytes=os.path.getsize(filePath))
+    return data
+
+def _pklLoad(filePath):
+    # assume we pickle in binary
+    with open(filePath, 'rb') as fh:
+        header = fh.read(len(_codec_magic))
+        if (header == _blob_magic):
+            return _blobLoad(fh,filePath)
+        if (header != _codec_magic):
+            # plain pickle
+            fh.seek(0)
+            return cPickle.load(fh,**kw_load)
+        n = struct.unpack("<B",fh.read(1))[0]
+        codec = fh.read(n).decode('utf8')
+        codec = _codec_aliases.get(codec,codec)
+        assert codec in _codecs , \
+            "{:s} needs codec {:s}, which isn't available".format(filePath,
+                                                                  codec)
+        reader = _codecs[codec][1](fh)
+        data = cPickle.load(reader,**kw_load)
+        reader.close()
+    return data
         
+class BackgroundWriter(object):
+    """
+    saves (via saveFile) on background threads, through a bounded queue, so 
+    that whoever is making the data doesn't wait on the disk. 
+
+    The first error raised by a save is re-raised by the next call to save,
+    wait, flush, or close; saves queued after an error are dropped. Data is
+    serialized when it is handed to save (on the caller's thread), so it can
+    be changed straight after; only the writing is in the background. With
+    freeze_arrays, data which is just arrays is instead made read-only until
+    it is written, and serialized on the writing thread.
+    """
+    def __init__(self,max_pending=8,n_threads=1,freeze_arrays=False):
+        """
+        Args:
+            max_pending: maximum number of queued saves; save blocks past this
+            n_threads: number of threads doing the saving
+            freeze_arrays: if true, an array (or tuple or list of arrays) 
+            isn't copied when it is handed to save; changing it in place
+            raises an error until it is on disk.
+        """
+        self.freeze_arrays = freeze_arrays
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._cond = threading.Condition()
+        self._pending = dict()
+        self._error = None
+        self._threads = [threading.Thread(target=self._run) 
+                         for _ in range(n_threads)]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+    def save(self,filePath,dataToSave,useNpy,on_done=None):
+        """
+        queues a save; see saveFile. on_done, if not None, is called with no 
+        arguments once the save is finished (or has failed)
+        """
+        self._raise_if_failed()
+        frozen = _freeze_arrays(dataToSave) if self.freeze_arrays else None
+        if (frozen is None):
+            dataToSave = _serialize(filePath,dataToSave,useNpy)
+        else:
+            on_done = _thaw_after(frozen,on_done)
+        with self._cond:
+            self._pending[filePath] = self._pending.get(filePath,0) + 1
+        self._queue.put((filePath,dataToSave,useNpy,on_done))
+    def is_pending(self,filePath):
+        with self._cond:
+            return filePath in self._pending
+    def wait(self,filePath):
+        """
+        blocks until every queued save of filePath is on disk 
+        """
+        with self._cond:
+            while filePath in self._pending:
+                self._cond.wait()
+        self._raise_if_failed()
+    def flush(self):
+        """
+        blocks until every queued save is on disk 
+        """
+        self._queue.join()
+        self._raise_if_failed()
+    def close(self):
+        """
+        flushes, then stops the threads
+        """
+        self._queue.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._raise_if_failed()
+    def __enter__(self):
+        return self
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # don't mask the original error with one of ours
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
+    def _raise_if_failed(self):
+        with self._cond:
+            error,self._error = self._error,None
+        if error is not None:
+            raise error
+    def _set_error(self,error):
+        with self._cond:
+            if self._error is None:
+                self._error = error
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            filePath,dataToSave,useNpy,on_done = item
+            try:
+                if self._error is None:
+                    saveFile(filePath,dataToSave,useNpy)
+            except Exception as e:
+                self._set_error(e)
+            finally:
+                try:
+                    if (on_done is not None):
+                        on_done()
+                except Exception as e:
+                    # the thread has to live to mark the save done 
+                    self._set_error(e)
+                with self._cond:
+                    self._pending[filePath] -= 1
+                    if (self._pending[filePath] == 0):
+                        self._pending.pop(filePath)
+                    self._cond.notify_all()
+                self._queue.task_done()
+
+# how many pending saves have made each array (by id) read-only
+_frozen_counts = dict()
+_frozen_lock = threading.Lock()
+
+def _freeze_arrays(data):
+    """
+    Returns:
+        list of the arrays in data (an array, or a tuple or list of them) 
+        which this made read-only, or None if data isn't just arrays
+    """
+    arrays = list(data) if isinstance(data,(tuple,list)) else [data]
+    if (len(arrays) == 0 or 
+        not all(isinstance(a,np.ndarray) and a.dtype != object 
+                for a in arrays)):
+        return None
+    frozen = []
+    with _frozen_lock:
+        for a in arrays:
+            # an array can be in more than one pending save 
+            if (id(a) in _frozen_counts):
+                _frozen_counts[id(a)] += 1
+            elif (a.flags.writeable):
+                a.flags.writeable = False
+                _frozen_counts[id(a)] = 1
+            else:
+                continue
+            frozen.append(a)
+    return frozen
+
+def _thaw_after(frozen,on_done):
+    # on_done, after making the frozen arrays writeable again (once no
+    # pending save has them)
+    def thaw():
+        try:
+            with _frozen_lock:
+                for a in frozen:
+                    _frozen_counts[id(a)] -= 1
+                    if (_frozen_counts[id(a)] == 0):
+                        _frozen_counts.pop(id(a))
+                        a.flags.writeable = True
+        finally:
+            if (on_done is not None):
+                on_done()
+    return thaw
+
+# if not None, where _checkpointGen and multi_load send their saves 
+_background_writer = None
+
+@contextmanager
+def write_behind(**kw):
+    """
+    within this context, checkpoints (_checkpointGen, and so getCheckpoint
+    and pipeline) and multi_load/lazy_multi_iter save in the background. 
+    Everything is flushed on exit.
+
+    Args:
+        **kw: passed to BackgroundWriter
+    Returns:
+        context manager, giving the BackgroundWriter
+    """
+    global _background_writer
+    previous = _background_writer
+    writer = BackgroundWriter(**kw)
+    _background_writer = writer
+    try:
+        with writer:
+            yield writer
+    finally:
+        _background_writer = previous
+
+def _save(filePath,dataToSave,useNpy,on_done=None):
+    # saveFile, or queue it if we are writing behind. on_done is called once
+    # the file is saved (or fails to)
+    if (_background_writer is None):
+        try:
+            saveFile(filePath,dataToSave,useNpy)
+        finally:
+            if (on_done is not None):
+                on_done()
+    else:
+        try:
+            _background_writer.save(filePath,dataToSave,useNpy,
+                                    on_done=on_done)
+        except BaseException:
+            # nothing was queued (e.g. the data can't be pickled, or an 
+            # earlier save failed), so on_done won't be called otherwise
+            if (on_done is not None):
+                on_done()
+            raise
+
+def _background_context(enabled):
+    # write_behind, if enabled and we aren't already writing behind
+    if (enabled and _background_writer is None):
+        return write_behind(freeze_arrays=True)
+    return nullcontext()
+
+def _wait_pending(filePath=None):
+    # make sure filePath (or everything, if None) is on disk before we read
+    if (_background_writer is None):
+        return
+    if (filePath is None):
+        _background_writer.flush()
+    else:
+        _background_writer.wait(filePath)
+
+def load_files(files,workers=None,pool="thread"):
+    """
+    loads (via lazy_load) each of files, possibly in parallel
+
+    Args:
+        files: list of files to load
+        workers: number of workers to use. None or 1 loads serially.
+        pool: either "thread" or "process". Threads are best when reading 
+        dominates (e.g. network file systems); processes when unpickling does 
+        (though the objects are pickled again to get back to us)
+    Returns:
+        list, element i is lazy_load(files[i])
+    """
+    if (workers is None or workers <= 1 or len(files) <= 1):
+        return [lazy_load(f) for f in files]
+    assert pool in ("thread","process") , "Unknown pool {:}".format(pool)
+    if (pool == "thread"):
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            # map keeps the order of files
+            return list(ex.map(lazy_load,files))
+    else:
+        # batch up the files, so we aren't paying for a round trip per file
+        chunksize = max(1,len(files) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            return list(ex.map(lazy_load,files,chunksize=chunksize))
+
 def lazy_multi_load(cache_dir,load_func=None,**kw):
     return multi_load(cache_dir,load_func=load_func,**kw)
         
 def multi_load(cache_dir,load_func,force=False,limit=None,ext=".pkl",
-               name_func=lambda i,o,*args,**kw: "{:d}".format(i)):
+               name_func=lambda i,o,*args,**kw: "{:d}".format(i),
+               workers=None,pool="thread",use_manifest=True,packed=False,
+               lazy=False,resume=True):
     """
     Returns the cached values if we can, otherwise re-runs load_func and returns
     everything
@@ -133,27 +2370,872 @@ def multi_load(cache_dir,load_func,force=False,limit=None,ext=".pkl",
         limit: maximum number to return. Caches everything it can 
         name_func: takes in iteration number, object, returns string for file 
                    name
+        workers,pool: for loading from the cache, see load_files 
+        lazy: if true, cache hits give a LazyHandle per file instead of the 
+        objects (so nothing is read until used)
+        use_manifest: if true, find the cached files from the directory's 
+        manifest (see read_manifest) rather than by listing it 
+        packed: if true, cache everything in a single PackedStore rather than
+        one file per object (ext, name_func, workers, and use_manifest are 
+        then ignored)
+        resume: if true and an earlier run stopped part way through (see 
+        multi_status), keep what it saved and only make the rest. Otherwise,
+        such a cache is made again from the start.
      
     Returns:
         at most limit objects, from the cache if possible 
     """
     pGenUtil.ensureDirExists(cache_dir)
-    files = sorted(pGenUtil.getAllFiles(cache_dir,ext=ext))
+    if (packed):
+        store = PackedStore(cache_dir)
+        action,start = _multi_plan(cache_dir,len(store),force,limit,resume,
+                                   packed=True)
+        if (action == "hit"):
+            _stats.record(store.data_path,hits=1)
+            return store.load(limit)
+        cached = store.load(start)
+        return cached + list(_packed_save_iter(cache_dir,
+                                               _timed_call(load_func,start),
+                                               limit,start))
+    _wait_pending()
+    files = _cached_files(cache_dir,ext,use_manifest)
+    action,start = _multi_plan(cache_dir,len(files),force,limit,resume)
+    if (action == "resume"):
+        cached = _progress_files(cache_dir)[:start]
+        if (lazy):
+            cached = [LazyHandle(f) for f in cached]
+        else:
+            cached = load_files(cached,workers=workers,pool=pool)
+        return cached + list(_multi_save_iter(cache_dir,
+                                              _timed_call(load_func,start),
+                                              limit,name_func,start))
     # if the files exist and we aren't forcing 
-    if (len(files) > 0 and not force):
-        return [lazy_load(f) for f in files[:limit]]
+    if (action == "hit"):
+        try:
+            if (lazy):
+                to_ret = [LazyHandle(f) for f in files[:limit]]
+            else:
+                to_ret = load_files(files[:limit],workers=workers,pool=pool)
+            # one record for the directory, as for a PackedStore
+            _stats.record(cache_dir,hits=1)
+            return to_ret
+        except (AssertionError,IOError,OSError):
+            if (not use_manifest):
+                raise
+            # manifest is out of date (e.g. files deleted by hand); start over
+            rebuild_manifest(cache_dir)
+            return multi_load(cache_dir,load_func,force=force,limit=limit,
+                              ext=ext,name_func=name_func,workers=workers,
+                              pool=pool,use_manifest=False,lazy=lazy,
+                              resume=resume)
     # get everything
-    examples = load_func()      
-    to_ret = []    
+    return list(_multi_save_iter(cache_dir,_timed_call(load_func),limit,
+                                 name_func))
+
+def lazy_multi_iter(cache_dir,load_func,force=False,limit=None,ext=".pkl",
+                    name_func=lambda i,o,*args,**kw: "{:d}".format(i),
+                    use_manifest=True,packed=False,prefetch=0,
+                    prefetch_bytes=None,resume=True):
+    """
+    like multi_load, except yields the objects one at a time, so only one is 
+    in memory at once (provided load_func is itself a generator)
+
+    Args:
+        see multi_load, except:
+        prefetch: if > 0, on a cache hit, load this many files ahead in 
+        background threads (see prefetch_iter)
+        prefetch_bytes: bound on the bytes loaded ahead (see prefetch_iter)
+    Returns:
+        generator over at most limit objects, from the cache if possible. 
+        When re-loading, each object is saved before it is yielded.
+    """
+    pGenUtil.ensureDirExists(cache_dir)
+    if (packed):
+        store = PackedStore(cache_dir)
+        action,start = _multi_plan(cache_dir,len(store),force,limit,resume,
+                                   packed=True)
+        if (action == "hit"):
+            _stats.record(store.data_path,hits=1)
+            source = store.iterate(limit)
+        else:
+            for e in store.iterate(start):
+                yield e
+            source = _packed_save_iter(cache_dir,_timed_call(load_func,start),
+                                       limit,start)
+        for e in source:
+            yield e
+        return
+    _wait_pending()
+    files = _cached_files(cache_dir,ext,use_manifest)
+    action,start = _multi_plan(cache_dir,len(files),force,limit,resume)
+    if (action == "resume"):
+        for f in _progress_files(cache_dir)[:start]:
+            yield lazy_load(f)
+    elif (action == "hit"):
+        _stats.record(cache_dir,hits=1)
+        paths = _hit_files(cache_dir,files,ext,limit,use_manifest)
+        if (prefetch > 0):
+            source = prefetch_iter(paths,depth=prefetch,
+                                   max_bytes=prefetch_bytes,load=lazy_load)
+        else:
+            source = (lazy_load(f) for f in paths)
+        for e in source:
+            yield e
+        return
+    for e in _multi_save_iter(cache_dir,_timed_call(load_func,start),limit,
+                              name_func,start):
+        yield e
+
+def _hit_files(cache_dir,files,ext,limit,use_manifest):
+    """
+    yields (at most limit of) files; if one is missing (and they came from a
+    stale manifest) carries on from a listing of the directory 
+    """
+    for i,f in enumerate(files[:limit]):
+        if (use_manifest and not pGenUtil.isfile(f)):
+            rebuild_manifest(cache_dir)
+            rest = [g for g in _cached_files(cache_dir,ext,False) if g > f]
+            n_left = None if limit is None else limit - i
+            for g in rest[:n_left]:
+                yield g
+            return
+        yield f
+
+def prefetch_iter(files,depth=2,max_bytes=None,load=None):
+    """
+    loads files in order, reading up to depth of them ahead on background 
+    threads while the caller works on the current one
+
+    Args:
+        files: iterable of paths (consumed only as far as needed)
+        depth: maximum number of files being read (or read and waiting) 
+        max_bytes: if not None, files are only read ahead while the total 
+        size (on disk) of what is read ahead stays under this. At least one
+        file is always read, however big.
+        load: function taking a path and returning its object; defaults to 
+        lazy_load
+    Returns:
+        generator of the loaded objects, in the order of files
+    """
+    load = lazy_load if load is None else load
+    files = iter(files)
+    pending = deque()
+    # [bytes read ahead, next file (if we couldn't fit it yet), exhausted]
+    state = [0,None,False]
+    def top_up(ex):
+        while (not state[2]) and len(pending) < depth:
+            if (state[1] is None):
+                try:
+                    state[1] = next(files)
+                except StopIteration:
+                    state[2] = True
+                    return
+            size = os.path.getsize(state[1])
+            if (len(pending) > 0 and max_bytes is not None and 
+                state[0] + size > max_bytes):
+                # wait for the caller to take something 
+                return
+            pending.append((ex.submit(load,state[1]),size))
+            state[0] += size
+            state[1] = None
+    with ThreadPoolExecutor(max_workers=max(1,depth)) as ex:
+        try:
+            top_up(ex)
+            while pending:
+                future,size = pending.popleft()
+                obj = future.result()
+                state[0] -= size
+                top_up(ex)
+                yield obj
+        finally:
+            # e.g. the caller stopped early; don't read what isn't wanted
+            for future,_ in pending:
+                future.cancel()
+
+def _timed_call(load_func,skip=0):
+    """
+    Args:
+        load_func: see multi_load
+        skip: number of objects to leave out from the start. If load_func 
+        takes a 'start' argument it is passed this; otherwise the objects are
+        made and thrown away.
+    Returns:
+        generator of (seconds to make,object) for each object from load_func;
+        the time load_func itself takes is put on the first object
+    """
+    start = time.time()
+    if (skip == 0):
+        examples = iter(load_func())
+    elif (_takes_start(load_func)):
+        examples = iter(load_func(start=skip))
+    else:
+        examples = itertools.islice(iter(load_func()),skip,None)
+    while True:
+        try:
+            e = next(examples)
+        except StopIteration:
+            return
+        yield time.time() - start,e
+        start = time.time()
+
+def _takes_start(load_func):
+    try:
+        params = inspect.signature(load_func).parameters
+    except (TypeError,ValueError):
+        return False
+    return "start" in params
+
+def _multi_save_iter(cache_dir,examples,limit,name_func,start=0):
+    """
+    saves and yields (at most limit of) examples; see multi_load. examples
+    are as from _timed_call, and start is the index of the first of them.
+    The cache is marked complete once everything is on disk.
+    """
+    _reset_progress(cache_dir,keep_progress=(start > 0))
+    i = start
     # use enumerate to allow for yield (in case of large files/large numbers)
-    for i,e in enumerate(examples):
+    for i,(seconds,e) in enumerate(examples,start):
         if (i == limit):
             break    
         name = "{:s}{:s}.pkl".format(cache_dir,name_func(i,e))
-        lazy_save(name,e)
-        to_ret.append(e)        
-    return to_ret 
+        # record the file in the manifest once it is on disk
+        on_done = lambda i=i,name=name,seconds=seconds: \
+            _multi_saved(cache_dir,i,name,seconds)
+        _save(name,e,useNpy=False,on_done=on_done)
+        yield e
+        i += 1
+    _wait_pending()
+    _mark_complete(cache_dir,i,limit if i == limit else None)
+
+def _multi_saved(cache_dir,i,name,seconds):
+    if (not os.path.exists(name)):
+        # the save failed; a resume has to make this one again
+        return
+    _manifest_append(cache_dir,name)
+    _progress_append(cache_dir,i,name)
+    _record_cost(name,seconds)
+    _stats.record(name,misses=1,compute_seconds=seconds)
+
+# each multi_load cache directory keeps a log of the objects saved so far, 
+# one 'index<tab>name' line per object (appended once it is on disk), and a
+# marker written only once everything asked for is saved. A log without a 
+# marker means the run that made it stopped part way through.
+progress_name = ".progress"
+complete_name = ".complete"
+
+def _progress_append(cache_dir,i,file_path):
+    line = "{:d}\t{:s}\n".format(i,os.path.basename(file_path))
+    with _manifest_lock:
+        with open(os.path.join(cache_dir,progress_name),'ab') as fh:
+            fh.write(line.encode('utf8'))
+
+def _progress_files(cache_dir):
+    """
+    Returns:
+        list of the files saved for objects 0,1,... (stopping at the first 
+        one missing), or None if cache_dir has no progress log
+    """
+    try:
+        with open(os.path.join(cache_dir,progress_name),'rb') as fh:
+            lines = fh.read().decode('utf8').split("\n")
+    except (IOError,OSError):
+        return None
+    names = dict()
+    for line in lines:
+        fields = line.split("\t")
+        if (len(fields) != 2 or not fields[0].isdigit()):
+            # blank, or a partial line from a writer that died
+            continue
+        names[int(fields[0])] = fields[1]
+    files = []
+    while len(files) in names:
+        f = os.path.join(cache_dir,names[len(files)])
+        if (not pGenUtil.isfile(f)):
+            break
+        files.append(f)
+    return files
+
+def _read_complete(cache_dir):
+    try:
+        with open(os.path.join(cache_dir,complete_name),'rb') as fh:
+            return json.loads(fh.read().decode('utf8'))
+    except (IOError,OSError,ValueError):
+        return None
+
+def _mark_complete(cache_dir,n,limit):
+    marker = json.dumps(dict(n=n,limit=limit))
+    with _atomic_open(os.path.join(cache_dir,complete_name)) as fh:
+        fh.write(marker.encode('utf8'))
+
+def _reset_progress(cache_dir,keep_progress=False):
+    # drops the marker (a run is starting) and, unless keep_progress (it is 
+    # resuming), the progress log
+    names = (complete_name,) if keep_progress else (complete_name,progress_name)
+    for name in names:
+        try:
+            os.remove(os.path.join(cache_dir,name))
+        except OSError:
+            pass
+
+def multi_status(cache_dir,limit=None,ext=".pkl",packed=False):
+    """
+    Args:
+        cache_dir: directory (as given to multi_load)
+        limit,ext,packed: see multi_load
+    Returns:
+        tuple of (status,number of objects saved) where status is one of:
+        "complete" (every object asked for is saved), "truncated" (a run 
+        stopped part way through; multi_load can resume it), "empty", or 
+        "legacy" (objects saved before progress was logged; taken as complete)
+    """
+    if (not os.path.isdir(cache_dir)):
+        return "empty",0
+    if (packed):
+        n_cached = len(PackedStore(cache_dir))
+    else:
+        # just asking, so leave a stale manifest for multi_load to re-make
+        n_cached = len(_cached_files(cache_dir,ext,True,rebuild=False))
+    return _multi_state(cache_dir,n_cached,limit,packed)
+
+def _multi_state(cache_dir,n_cached,limit,packed):
+    if (packed):
+        # a store holds exactly the objects it has saved, in order
+        saved = n_cached if n_cached > 0 else None
+    else:
+        files = _progress_files(cache_dir)
+        saved = None if files is None else len(files)
+    marker = _read_complete(cache_dir)
+    if (marker is not None and (marker["limit"] is None or 
+                                (limit is not None and 
+                                 limit <= marker["limit"]))):
+        # the marker only says what was saved; check it is all still there
+        needed = marker["n"] if limit is None else min(limit,marker["n"])
+        found = n_cached if saved is None else saved
+        if (found >= needed):
+            return "complete",found
+        return "truncated",found
+    if (saved is None):
+        return ("empty",0) if n_cached == 0 else ("legacy",n_cached)
+    if (limit is not None and saved >= limit):
+        return "complete",saved
+    return "truncated",saved
+
+def _multi_plan(cache_dir,n_cached,force,limit,resume,packed=False):
+    """
+    Returns:
+        tuple of (action,start): action is "hit" (load everything from the 
+        cache), "resume" (load the first start objects from the cache, make 
+        the rest) or "make" (make everything; start is 0) 
+    """
+    if (force):
+        return "make",0
+    status,saved = _multi_state(cache_dir,n_cached,limit,packed)
+    if (status in ("complete","legacy") and n_cached > 0):
+        return "hit",0
+    if (status == "truncated" and resume and saved > 0):
+        return "resume",saved
+    return "make",0
+
+# each multi_load cache directory keeps an append-only manifest of the files 
+# saved into it, one 'name<tab>size<tab>mtime in ns' line per save (later 
+# lines win), so that cache hits don't have to list the directory.
+manifest_name = ".manifest"
+_manifest_lock = threading.Lock()
+
+def _manifest_path(cache_dir):
+    return os.path.join(cache_dir,manifest_name)
+
+def read_manifest(cache_dir):
+    """
+    Args:
+        cache_dir: directory (as given to multi_load)
+    Returns:
+        OrderedDict of file name -> (size in bytes, mtime in ns), in the order
+        the files were first recorded, or None if there is no manifest
+    """
+    entries = OrderedDict()
+    try:
+        with open(_manifest_path(cache_dir),'rb') as fh:
+            lines = fh.read().decode('utf8').split("\n")
+    except (IOError,OSError):
+        return None
+    for line in lines:
+        fields = line.split("\t")
+        if (len(fields) != 3):
+            # blank, or a partial line from a writer that died
+            continue
+        entries[fields[0]] = (int(fields[1]),int(fields[2]))
+    return entries
+
+def rebuild_manifest(cache_dir):
+    """
+    re-writes the manifest of cache_dir from a listing of the directory
+
+    Args:
+        cache_dir: directory (as given to multi_load)
+    Returns:
+        see read_manifest
+    """
+    entries = OrderedDict()
+    for f in sorted(os.listdir(cache_dir)):
+        full = os.path.join(cache_dir,f)
+        if (_is_bookkeeping(f) or not os.path.isfile(full)):
+            continue
+        stat = os.stat(full)
+        entries[f] = (stat.st_size,stat.st_mtime_ns)
+    lines = ["{:s}\t{:d}\t{:d}\n".format(f,*v) for f,v in entries.items()]
+    with _manifest_lock:
+        with _atomic_open(_manifest_path(cache_dir)) as fh:
+            fh.write("".join(lines).encode('utf8'))
+        # renaming it into place touched the directory; the manifest has to 
+        # be at least as new, or it looks stale (see _manifest_stale)
+        os.utime(_manifest_path(cache_dir))
+    return entries
+
+def _is_bookkeeping(name):
+    # if name is one of the files kept next to the checkpoints, not one of 
+    # them (and so never listed as one)
+    return (name in (manifest_name,progress_name,complete_name,costs_name,
+                     blob_root_marker) or 
+            name.endswith((lock_ext,fingerprint_ext)) or 
+            _tmp_pattern.search(name) is not None)
+
+def _manifest_stale(cache_dir):
+    """
+    Returns:
+        true if files may have been added to (or removed from) cache_dir 
+        since its manifest was last written; costs one stat of each
+    """
+    try:
+        listed = os.stat(_manifest_path(cache_dir)).st_mtime_ns
+        changed = os.stat(cache_dir).st_mtime_ns
+    except OSError:
+        return True
+    return changed > listed
+
+def _manifest_append(cache_dir,file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        # the save failed; nothing to record
+        return
+    name = os.path.basename(file_path)
+    line = "{:s}\t{:d}\t{:d}\n".format(name,stat.st_size,stat.st_mtime_ns)
+    with _manifest_lock:
+        with open(_manifest_path(cache_dir),'ab') as fh:
+            fh.write(line.encode('utf8'))
+
+def _cached_files(cache_dir,ext,use_manifest,rebuild=True):
+    """
+    Returns:
+        sorted list of the checkpoints in cache_dir ending with ext (not the
+        bookkeeping files next to them); from the manifest if use_manifest 
+        (re-making it if it is missing or the directory changed since, or
+        just listing the directory if rebuild is false)
+    """
+    entries = read_manifest(cache_dir) if use_manifest else None
+    if (entries is not None and _manifest_stale(cache_dir)):
+        entries = None
+    if (entries is None and use_manifest and rebuild):
+        entries = rebuild_manifest(cache_dir)
+    if (entries is None):
+        files = pGenUtil.getAllFiles(cache_dir,ext=ext)
+        return sorted(f for f in files 
+                      if not _is_bookkeeping(os.path.basename(f)))
+    path = os.path.join(cache_dir,'')
+    return sorted(path + f for f in entries 
+                  if (ext is None or f.endswith(ext)) and 
+                  not _is_bookkeeping(f))
     
+class PackedStore(object):
+    """
+    append-only store of pickled objects in a directory: one data file with
+    the pickles back to back, and an index file of fixed-size (offset,length)
+    records, one per object. An object only 'exists' once its index record
+    is written, so a reader never sees a partial append.
+    """
+    _record = struct.Struct("<QQ")
+    def __init__(self,cache_dir,name="packed"):
+        """
+        Args:
+            cache_dir: directory for the store 
+            name: stem of the data (.dat) and index (.idx) files 
+        """
+        path = os.path.join(cache_dir,'')
+        self.data_path = path + name + ".dat"
+        self.index_path = path + name + ".idx"
+    def __len__(self):
+        try:
+            return os.path.getsize(self.index_path) // self._record.size
+        except OSError:
+            return 0
+    def __getitem__(self,i):
+        """
+        Args:
+            i: index of the object (negative counts from the end)
+        Returns:
+            the object, read with one seek into the index and one into the data
+        """
+        n = len(self)
+        if (i < 0):
+            i += n
+        if not (0 <= i < n):
+            raise IndexError("{:d} out of range for {:d} objects".format(i,n))
+        with open(self.index_path,'rb') as fh:
+            fh.seek(i * self._record.size)
+            offset,length = self._record.unpack(fh.read(self._record.size))
+        with open(self.data_path,'rb') as fh:
+            fh.seek(offset)
+            return cPickle.loads(fh.read(length),**kw_load)
+    def __iter__(self):
+        return self.iterate()
+    def records(self,limit=None):
+        """
+        Returns:
+            list of (offset,length) of (at most limit of) the objects 
+        """
+        n = len(self) if limit is None else min(limit,len(self))
+        if (n == 0):
+            return []
+        with open(self.index_path,'rb') as fh:
+            raw = fh.read(n * self._record.size)
+        return list(self._record.iter_unpack(raw))
+    def iterate(self,limit=None):
+        """
+        Returns:
+            generator over (at most limit of) the objects, in order; the data 
+            file is read front to back 
+        """
+        records = self.records(limit)
+        if (len(records) == 0):
+            return
+        with open(self.data_path,'rb',buffering=1 << 20) as fh:
+            for offset,length in records:
+                if (fh.tell() != offset):
+                    fh.seek(offset)
+                yield cPickle.loads(fh.read(length),**kw_load)
+    def load(self,limit=None):
+        return list(self.iterate(limit))
+    def append(self,obj):
+        """
+        Returns:
+            the index of obj 
+        """
+        for i,_ in self.append_iter([obj]):
+            return i
+    def append_iter(self,objects):
+        """
+        appends each of objects, holding the store's lock throughout
+
+        Args:
+            objects: iterable
+        Returns:
+            generator of (index,object), each yielded once it is appended 
+        """
+        pGenUtil.ensureDirExists(pGenUtil.getBasePath(self.data_path))
+        with FileLock(self.data_path + lock_ext):
+            with open(self.data_path,'ab') as data_fh, \
+                 open(self.index_path,'ab') as index_fh:
+                # drop any partial record from an append which died
+                n = index_fh.seek(0,os.SEEK_END) // self._record.size
+                index_fh.truncate(n * self._record.size)
+                index_fh.seek(0,os.SEEK_END)
+                offset = data_fh.seek(0,os.SEEK_END)
+                for obj in objects:
+                    raw = cPickle.dumps(obj,cPickle.HIGHEST_PROTOCOL)
+                    data_fh.write(raw)
+                    # data has to be there before the index says it is 
+                    data_fh.flush()
+                    index_fh.write(self._record.pack(offset,len(raw)))
+                    index_fh.flush()
+                    offset += len(raw)
+                    yield n,obj
+                    n += 1
+    def clear(self):
+        with FileLock(self.data_path + lock_ext):
+            for f in (self.index_path,self.data_path):
+                if os.path.exists(f):
+                    os.remove(f)
+
+def _packed_save_iter(cache_dir,examples,limit,start=0):
+    """
+    like _multi_save_iter, for a PackedStore (which is started over, unless
+    start > 0, in which case it must already hold start objects)
+    """
+    store = PackedStore(cache_dir)
+    _reset_progress(cache_dir,keep_progress=(start > 0))
+    if (start == 0):
+        store.clear()
+    seconds = [0]
+    def _limited():
+        for i,(t,e) in enumerate(examples,start):
+            if (i == limit):
+                break
+            seconds[0] += t
+            yield e
+    try:
+        for _,e in store.append_iter(_limited()):
+            yield e
+        n = len(store)
+        _mark_complete(cache_dir,n,limit if n == limit else None)
+    finally:
+        _record_cost(store.data_path,seconds[0])
+        _stats.record(store.data_path,misses=1,compute_seconds=seconds[0],
+                      bytes=os.path.getsize(store.data_path) 
+                      if os.path.exists(store.data_path) else 0)
+
+# each directory with checkpoints keeps an append-only ledger of how long 
+# each took to compute, one 'name<tab>seconds' line per save (later lines win)
+costs_name = ".costs"
+# temporary files from _atomic_open
+_tmp_pattern = re.compile(r"\.tmp\d+_\d+$")
+
+def _record_cost(file_path,seconds):
+    ledger = os.path.join(os.path.dirname(file_path),costs_name)
+    line = "{:s}\t{:.6g}\n".format(os.path.basename(file_path),seconds)
+    with _manifest_lock:
+        with open(ledger,'ab') as fh:
+            fh.write(line.encode('utf8'))
+
+def _prune_costs(file_paths):
+    # drops the (evicted) file_paths from their directories' cost ledgers
+    by_directory = dict()
+    for f in file_paths:
+        directory,name = os.path.split(f)
+        by_directory.setdefault(directory,set()).add(name)
+    for directory,names in by_directory.items():
+        ledger = os.path.join(directory,costs_name)
+        with _manifest_lock:
+            try:
+                with open(ledger,'rb') as fh:
+                    lines = fh.read().decode('utf8').split("\n")
+            except (IOError,OSError):
+                continue
+            kept = [l for l in lines 
+                    if l and l.split("\t")[0] not in names]
+            if (len(kept) == 0):
+                os.remove(ledger)
+                continue
+            with _atomic_open(ledger) as fh:
+                fh.write("".join(l + "\n" for l in kept).encode('utf8'))
+
+def read_costs(directory):
+    """
+    Args:
+        directory: where the checkpoints are
+    Returns:
+        dictionary of file name -> seconds it took to compute, for each 
+        checkpoint in directory with a recorded cost 
+    """
+    costs = dict()
+    try:
+        with open(os.path.join(directory,costs_name),'rb') as fh:
+            lines = fh.read().decode('utf8').split("\n")
+    except (IOError,OSError):
+        return costs
+    for line in lines:
+        fields = line.split("\t")
+        if (len(fields) == 2):
+            try:
+                costs[fields[0]] = float(fields[1])
+            except ValueError:
+                continue
+    return costs
+
+class CacheEntry(object):
+    """
+    a unit of eviction for CacheManager: either a single checkpoint file 
+    (plus its fingerprint) or an entire multi_load directory
+    """
+    def __init__(self,key,paths,n_bytes,last_access,cost,blobs=()):
+        """
+        Args:
+            key: the checkpoint file, or the multi_load directory
+            paths: every file to remove when evicting 
+            n_bytes: total size of paths
+            last_access: latest access (or modification) time of paths
+            cost: seconds it took to compute (0 if unknown)
+            blobs: the BlobStore blobs paths refer to (see blob_refs), which
+            are removed once no remaining entry refers to them. n_bytes 
+            doesn't include them, since they may be shared.
+        """
+        self.key = key
+        self.paths = paths
+        self.n_bytes = n_bytes
+        self.last_access = last_access
+        self.cost = cost
+        self.blobs = set(blobs)
+    def __repr__(self):
+        return "CacheEntry({:s},{:d} bytes,{:.3g}s)".format(self.key,
+                                                            self.n_bytes,
+                                                            self.cost)
+
+class CacheManager(object):
+    """
+    keeps the checkpoints under a root directory within a byte budget, by 
+    evicting either the least recently used checkpoints ('lru'), or the ones
+    which are cheapest to recompute per byte ('cost'; uses the time recorded
+    when each was made, unknown times count as free). multi_load directories
+    are evicted as a whole, so they are never left partial. Blobs (see 
+    BlobStore) count towards the budget once each, and are removed along with
+    the last checkpoint under root using them.
+    """
+    def __init__(self,root,max_bytes,policy="lru"):
+        """
+        Args:
+            root: directory holding the checkpoints (searched recursively)
+            max_bytes: budget for everything under root
+            policy: either 'lru' or 'cost'
+        """
+        assert policy in ("lru","cost") , "Unknown policy {:}".format(policy)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.policy = policy
+    def entries(self):
+        """
+        Returns:
+            list of CacheEntry, one per checkpoint under root 
+        """
+        to_ret = []
+        for directory,dirs,files in os.walk(self.root):
+            if (blob_root_marker in files):
+                # a BlobStore; each blob goes with the entries using it
+                dirs[:] = []
+                continue
+            costs = read_costs(directory)
+            stats = dict()
+            for f in files:
+                if (f.endswith(lock_ext) or _tmp_pattern.search(f)):
+                    continue
+                try:
+                    stats[f] = os.stat(os.path.join(directory,f))
+                except OSError:
+                    # removed out from under us
+                    continue
+            if (manifest_name in stats or 
+                os.path.basename(PackedStore(directory).index_path) in stats):
+                to_ret.append(self._entry(directory,directory,stats,
+                                          sum(costs.values())))
+                continue
+            for f in stats:
+                if (f == costs_name or f.endswith(_sidecar_exts)):
+                    continue
+                # e.g. its fingerprint, or (for a ChunkedArray) its data
+                group = dict( (g,stats[g]) for g in stats 
+                              if g == f or (g.startswith(f + ".") and 
+                                            g.endswith(_sidecar_exts)))
+                to_ret.append(self._entry(os.path.join(directory,f),
+                                          directory,group,costs.get(f,0)))
+        return to_ret
+    def _entry(self,key,directory,stats,cost):
+        paths = [os.path.join(directory,f) for f in stats]
+        n_bytes = sum(s.st_size for s in stats.values())
+        # atime may not be updated (noatime, relatime), so fall back on mtime
+        last = max(max(s.st_atime,s.st_mtime) for s in stats.values())
+        blobs = set()
+        for p in paths:
+            blobs.update(blob_refs(p))
+        return CacheEntry(key,paths,n_bytes,last,cost,blobs)
+    @staticmethod
+    def _blob_sizes(entries):
+        """
+        Returns:
+            dict of blob -> size, for every (existing) blob entries refer to 
+        """
+        sizes = dict()
+        for e in entries:
+            for b in e.blobs:
+                if (b not in sizes and os.path.exists(b)):
+                    sizes[b] = os.path.getsize(b)
+        return sizes
+    def total_bytes(self):
+        entries = self.entries()
+        return sum(e.n_bytes for e in entries) + \
+            sum(self._blob_sizes(entries).values())
+    def eviction_order(self,entries=None):
+        """
+        Returns:
+            entries (default: all of them), most evictable first
+        """
+        entries = self.entries() if entries is None else entries
+        if (self.policy == "lru"):
+            key = lambda e: e.last_access
+        else:
+            key = lambda e: (e.cost/max(e.n_bytes,1),e.last_access)
+        return sorted(entries,key=key)
+    def enforce(self,dry_run=False):
+        """
+        evicts checkpoints until everything under root fits in max_bytes
+
+        Args:
+            dry_run: if true, just returns what would be evicted
+        Returns:
+            list of evicted CacheEntry
+        """
+        entries = self.entries()
+        blob_sizes = self._blob_sizes(entries)
+        users = dict( (b,0) for b in blob_sizes)
+        for e in entries:
+            for b in e.blobs:
+                if (b in users):
+                    users[b] += 1
+        total = sum(e.n_bytes for e in entries) + sum(blob_sizes.values())
+        evicted = []
+        for e in self.eviction_order(entries):
+            if (total <= self.max_bytes):
+                break
+            if (not dry_run and not self._evict(e)):
+                continue
+            total -= e.n_bytes
+            unused = []
+            for b in e.blobs:
+                if (b not in users):
+                    continue
+                users[b] -= 1
+                if (users[b] == 0):
+                    unused.append(b)
+            if (not dry_run):
+                # (a save may have just started using one again)
+                unused = _remove_blobs(unused,min_age=blob_grace_seconds)
+            total -= sum(blob_sizes[b] for b in unused)
+            evicted.append(e)
+        if (not dry_run):
+            _prune_costs([e.key for e in evicted if not os.path.isdir(e.key)])
+        return evicted
+    @staticmethod
+    def _evict(e):
+        """
+        removes the files of e; a single checkpoint is removed (with its lock
+        file) while holding its lock, so never while it is being made
+
+        Returns:
+            true if e was removed, false if it was re-made since we looked
+        """
+        def remove():
+            for path in e.paths:
+                _memory_cache.invalidate(os.path.abspath(path))
+                if os.path.exists(path):
+                    os.remove(path)
+        if (os.path.isdir(e.key)):
+            remove()
+            return True
+        with _checkpoint_lock(e.key) as lock:
+            if (os.path.exists(e.key) and 
+                os.path.getmtime(e.key) > e.last_access):
+                return False
+            remove()
+            lock.remove()
+        return True
+
+def enforce_budget(root,max_bytes,policy="lru",dry_run=False):
+    """
+    convenience wrapper; see CacheManager
+
+    Returns:
+        list of evicted CacheEntry 
+    """
+    return CacheManager(root,max_bytes,policy=policy).enforce(dry_run=dry_run)
+
 def _checkpointGen(filePath,orCall,force,unpack,useNpy,*args,**kwargs):
     """
     this is a way of caching data, or reading the cached data out if it 
@@ -174,16 +3256,51 @@ def _checkpointGen(filePath,orCall,force,unpack,useNpy,*args,**kwargs):
     # 'Unpack' unpacks the array upon a load. This makes it 'look' like a 
     # simple function call (returns the args, or a tuple list of args)
     # use unpack if you aren't dealing with dictionaries or things like that
+    _wait_pending(filePath)
     if pGenUtil.isfile(filePath) and not force:
-        return loadFile(filePath,useNpy)
-    else:
-        # couldn't find the file.
-        # make sure it exists
+        _stats.record(filePath,hits=1)
+        return loadFile(filePath,useNpy,unpack=unpack)
+    # couldn't find the file (or forcing). Only one process should make it,
+    # so take the lock; whoever had it before us may have just made it.
+    stamp_before = _file_stamp_or_none(filePath)
+    lock = _checkpoint_lock(filePath)
+    lock.acquire()
+    try:
+        stamp_now = _file_stamp_or_none(filePath)
+        if (stamp_now is not None and (not force or stamp_now != stamp_before)):
+            lock.release()
+            _stats.record(filePath,hits=1)
+            return loadFile(filePath,useNpy,unpack=unpack)
         # POST: we can put our file here
+        start = time.time()
         dataToSave = orCall(*args,**kwargs)
-        # save the data, so next time we can just load
-        saveFile(filePath,dataToSave,useNpy)
-        return dataToSave
+        seconds = time.time() - start
+    except BaseException:
+        lock.release()
+        raise
+    if (force):
+        _stats.record(_saved_path(filePath,useNpy),forced=1,
+                      compute_seconds=seconds)
+    else:
+        _stats.record(_saved_path(filePath,useNpy),misses=1,
+                      compute_seconds=seconds)
+    # save the data, so next time we can just load. The lock is held until
+    # the file is on disk (which may be in the background)
+    def on_done():
+        try:
+            _record_cost(_saved_path(filePath,useNpy),seconds)
+        finally:
+            lock.release()
+    _save(filePath,dataToSave,useNpy,on_done=on_done)
+    if (_loads_as_store(filePath)):
+        # a hit gives the store, not the array, so a miss should too
+        _wait_pending(filePath)
+        return loadFile(filePath,useNpy,unpack=unpack)
+    return dataToSave
+
+def _loads_as_store(filePath):
+    # if loadFile gives an on-disk store for filePath rather than the data
+    return _is_chunk_path(filePath) or _is_grow_path(filePath)
 
 
 def _pipeHelper(objectToPipe,force,useNpy,otherArgs = None):
@@ -219,7 +3336,82 @@ def _pipeListParser(value,default,length):
         return value
     return safeList 
 
-def pipeline(objects,force=None):
+# appended to a checkpoint's path to get the record of what made it; see
+# _fingerprint_pipeline
+fingerprint_ext = ".fingerprint"
+# files which belong to (and are evicted with) the checkpoint they extend
+_sidecar_exts = (fingerprint_ext,chunk_data_ext)
+
+def data_hash(data):
+    """
+    Returns:
+        hex digest of data; arrays are hashed by their buffers 
+    """
+    h = hashlib.sha1()
+    _hash_update(h,data)
+    return h.hexdigest()
+
+def _read_fingerprint(filePath):
+    try:
+        with open(filePath + fingerprint_ext,'rb') as fh:
+            return json.loads(fh.read().decode('utf8'))
+    except (IOError,OSError,ValueError):
+        return None
+
+def _write_fingerprint(filePath,key,content):
+    record = dict(key=key,content=content)
+    with _atomic_open(filePath + fingerprint_ext) as fh:
+        fh.write(json.dumps(record).encode('utf8'))
+
+def _remove_fingerprint(filePath):
+    if os.path.exists(filePath + fingerprint_ext):
+        os.remove(filePath + fingerprint_ext)
+
+def _fingerprint_pipeline(objects,force):
+    """
+    pipeline, except each stage is re-run only if its fingerprint (a hash of
+    its function's code, its extra arguments, and the hash of the previous 
+    stage's output) differs from what was recorded when it was last made. 
+    Since the fingerprint uses the *output* of the previous stage, a stage 
+    whose re-run gives identical output doesn't cause its downstream stages 
+    to re-run. Checkpoints without a recorded fingerprint are re-run once.
+
+    Args:
+        see pipeline
+    Returns:
+        see pipeline
+    """
+    numObjects = len(objects)
+    force = _pipeListParser(force,False,numObjects)
+    numpy = [ not o[pipe_fileIdx].endswith('.pkl') for o in objects] 
+    # hash of the previous output, and the output itself (if we have it)
+    prev_hash = ""
+    prev_loaded,otherArgs = False,None
+    for i,o in enumerate(objects):
+        file_path = o[pipe_fileIdx]
+        key = checkpoint_key(o[pipe_funcIdx],prev_hash,*o[pipe_funcIdx+1:])
+        record = _read_fingerprint(file_path)
+        if (not force[i] and pGenUtil.isfile(file_path) and 
+            record is not None and record.get('key',None) == key):
+            # up to date; don't load it unless something downstream runs
+            prev_hash = record['content']
+            prev_loaded,otherArgs = False,None
+            continue
+        if (i > 0 and not prev_loaded):
+            otherArgs = _pipeHelper(objects[i-1],False,numpy[i-1])
+        # in case we die before we finish, this stage is stale
+        _remove_fingerprint(file_path)
+        otherArgs = _pipeHelper(o,True,numpy[i],otherArgs)
+        # only record the fingerprint once the checkpoint is on disk 
+        _wait_pending(file_path)
+        prev_hash = data_hash(otherArgs)
+        prev_loaded = True
+        _write_fingerprint(file_path,key,prev_hash)
+    if (not prev_loaded):
+        otherArgs = _pipeHelper(objects[-1],False,numpy[-1])
+    return otherArgs
+
+def pipeline(objects,force=None,fingerprint=False,background_save=False):
     # objects are a list, each element is : [<file>,<function>,<args>]: 
     # file name,
     # function then the ('extra' args the funcion
@@ -231,7 +3423,20 @@ def pipeline(objects,force=None):
     # f2(f2_chain,f2_args), returning f3_chain
     # ...
     # fN(fN_chain,fNargs), returning whatever.
+    # if fingerprint is true, only stages whose code, arguments, or input
+    # changed are re-run; see _fingerprint_pipeline
+    # if background_save is true, each stage's output is handed straight to
+    # the next while only the writing of its checkpoint is deferred (see 
+    # write_behind). Outputs which are just arrays aren't copied: they are
+    # read-only until written, so a stage changing its input in place gets
+    # an error. Anything else is serialized first, on this thread. The stage
+    # before the first one to run is still loaded from disk. Everything is 
+    # on disk by the time we return 
+    run = _fingerprint_pipeline if fingerprint else _linear_pipeline
+    with _background_context(background_save):
+        return run(objects,force)
 
+def _linear_pipeline(objects,force):
     filesExist = [pGenUtil.isfile(o[pipe_fileIdx]) for o in objects]
     numObjects = len(objects)
     # get a list of forces
@@ -260,3 +3465,163 @@ def pipeline(objects,force=None):
             otherArgs = _pipeHelper(objects[i],force[i],numpy[i],otherArgs)
     return otherArgs
 
+class PipelineStage(object):
+    """
+    one named step of a dag_pipeline. Like an element of pipeline, except 
+    its inputs are the outputs of the stages it depends on (each as a single
+    argument, in the order of depends_on), followed by args and kwargs.
+    """
+    def __init__(self,name,file_path,func,depends_on=(),args=(),kwargs=None,
+                 use_npy=None):
+        """
+        Args:
+            name: unique name of this stage
+            file_path: where this stage is checkpointed
+            func: makes the output of this stage 
+            depends_on: names of the stages whose outputs func takes
+            args,kwargs: extra arguments to func
+            use_npy: if the checkpoint should use numpy. Default (None) is 
+            like pipeline: numpy unless file_path ends with .pkl
+        """
+        self.name = name
+        self.file_path = file_path
+        self.func = func
+        self.depends_on = list(depends_on)
+        self.args = list(args)
+        self.kwargs = dict() if kwargs is None else kwargs
+        if (use_npy is None):
+            use_npy = not file_path.endswith('.pkl')
+        self.use_npy = use_npy
+    def __repr__(self):
+        return "PipelineStage({:s}<-{:})".format(self.name,self.depends_on)
+
+def _dag_order(stages):
+    """
+    Args:
+        stages: list of PipelineStage
+    Returns:
+        tuple of (dictionary of name -> stage, list of names such that every
+        stage comes after the stages it depends on)
+    """
+    by_name = OrderedDict()
+    for s in stages:
+        assert s.name not in by_name , "Duplicate stage {:s}".format(s.name)
+        by_name[s.name] = s
+    for s in stages:
+        for d in s.depends_on:
+            assert d in by_name , \
+                "Stage {:s} depends on unknown stage {:s}".format(s.name,d)
+    # Kahn's algorithm, keeping the given order among independent stages 
+    n_deps = dict( (s.name,len(set(s.depends_on))) for s in stages)
+    children = dict( (s.name,[]) for s in stages)
+    for s in stages:
+        for d in set(s.depends_on):
+            children[d].append(s.name)
+    order = []
+    ready = [s.name for s in stages if n_deps[s.name] == 0]
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for c in children[name]:
+            n_deps[c] -= 1
+            if (n_deps[c] == 0):
+                ready.append(c)
+    assert len(order) == len(stages) , \
+        "Stages have a cycle among {:}".format(
+            [n for n in by_name if n not in order])
+    return by_name,order
+
+def _dag_plan(by_name,order,force,targets):
+    """
+    decides which stages of a dag must be re-run, and which must be loaded 
+
+    Args:
+        see dag_pipeline, except by_name and order are from _dag_order
+    Returns:
+        tuple of (set of stage names to run, list of names to run or load
+        in order)
+    """
+    if force is True:
+        forced = set(order)
+    elif force is None or force is False:
+        forced = set()
+    else:
+        forced = set(force)
+    # a stage re-runs if forced, missing, or anything upstream re-runs
+    run = set()
+    for name in order:
+        s = by_name[name]
+        if (name in forced or not pGenUtil.isfile(s.file_path) or
+            any(d in run for d in s.depends_on)):
+            run.add(name)
+    # we need the targets, and the inputs of anything which runs
+    needed = set(targets)
+    for name in reversed(order):
+        if (name in needed and name in run):
+            needed.update(by_name[name].depends_on)
+    return run,[n for n in order if n in needed]
+
+def _dag_stage(stage,run,inputs):
+    # runs (if run) or loads the checkpoint of a single stage
+    args = list(inputs) + stage.args
+    return _checkpointGen(stage.file_path,stage.func,run,True,stage.use_npy,
+                          *args,**stage.kwargs)
+
+def dag_pipeline(stages,force=None,targets=None,workers=None,
+                 background_save=False):
+    """
+    like pipeline, except the stages form a directed acyclic graph: a stage
+    may feed several others, and stages which don't depend on each other 
+    run concurrently. Each stage is checkpointed to its file_path, just as 
+    in pipeline. Stages are re-run if forced, if their file is missing, or 
+    if any stage they depend on is re-run; stages whose outputs aren't 
+    needed aren't loaded at all.
+
+    Args:
+        stages: list of PipelineStage
+        force: True (re-run everything), or collection of stage names to
+        re-run. None or False re-runs only what is missing.
+        targets: names of the stages whose outputs to return. Defaults to 
+        the stages nothing depends on.
+        workers: number of threads to run stages on. None or 1 runs them 
+        one at a time, in order.
+        background_save: see pipeline
+    Returns:
+        dictionary of target name -> output 
+    """
+    with _background_context(background_save):
+        return _dag_pipeline(stages,force,targets,workers)
+
+def _dag_pipeline(stages,force,targets,workers):
+    by_name,order = _dag_order(stages)
+    if (targets is None):
+        upstream = set(d for s in stages for d in s.depends_on)
+        targets = [n for n in order if n not in upstream]
+    run,needed = _dag_plan(by_name,order,force,targets)
+    results = dict()
+    # stages we just load don't need their inputs 
+    inputs = lambda s: [results[d] for d in s.depends_on] \
+        if s.name in run else []
+    if (workers is None or workers <= 1):
+        for name in needed:
+            s = by_name[name]
+            results[name] = _dag_stage(s,name in run,inputs(s))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            todo = list(needed)
+            running = dict()
+            while todo or running:
+                # start everything whose inputs are ready 
+                for name in list(todo):
+                    s = by_name[name]
+                    if (name in run and 
+                        not all(d in results for d in s.depends_on)):
+                        continue
+                    todo.remove(name)
+                    f = ex.submit(_dag_stage,s,name in run,inputs(s))
+                    running[f] = name
+                done,_ = wait(list(running.keys()),return_when=FIRST_COMPLETED)
+                for f in done:
+                    # result() re-raises whatever the stage raised
+                    results[running.pop(f)] = f.result()
+    return dict( (t,results[t]) for t in targets)